@@ -121,14 +121,124 @@ def str_to_bool(value):
     return bool(value)
 
 CAMERA_SETTINGS = {
+    # Flip/xoay làm lossless trên JPEG của camera (nguồn http, cần libturbojpeg) và gửi thẳng không encode lại;
+    # nguồn rtsp (H.264) không có JPEG nên mỗi frame vẫn decode + flip + encode
     'FLIP_HORIZONTAL': str_to_bool(os.getenv('CAMERA_FLIP_HORIZONTAL', 'True')),
     'FLIP_VERTICAL': str_to_bool(os.getenv('CAMERA_FLIP_VERTICAL', 'True')),
     'ROTATE_180': str_to_bool(os.getenv('CAMERA_ROTATE_180', 'False')),
     'DETECTION_ENABLED': str_to_bool(os.getenv('CAMERA_DETECTION_ENABLED', 'True')),
     'DETECTION_INTERVAL': int(os.getenv('CAMERA_DETECTION_INTERVAL', '5')),
     'DETECTION_CONFIDENCE_THRESHOLD': float(os.getenv('DETECTION_CONFIDENCE_THRESHOLD', '0.5')),
+    # Motion gate (tắt mặc định): cảnh tĩnh thì bỏ qua YOLO và dùng lại kết quả cũ
+    'MOTION_GATE_ENABLED': str_to_bool(os.getenv('CAMERA_MOTION_GATE_ENABLED', 'False')),
+    'MOTION_THRESHOLD': float(os.getenv('CAMERA_MOTION_THRESHOLD', '0.01')),
+    'MOTION_PIXEL_DELTA': int(os.getenv('CAMERA_MOTION_PIXEL_DELTA', '15')),
+    'MOTION_HYSTERESIS_FRAMES': int(os.getenv('CAMERA_MOTION_HYSTERESIS_FRAMES', '5')),
+    'MOTION_MAX_SKIP_SECONDS': float(os.getenv('CAMERA_MOTION_MAX_SKIP_SECONDS', '10')),
+    # Tracker: chạy cat detector mỗi N frame, các frame ở giữa dùng IoU/Kalman tracker
+    'TRACKER_DETECT_EVERY': int(os.getenv('CAMERA_TRACKER_DETECT_EVERY', '4')),
+    'TRACKER_IOU_THRESHOLD': float(os.getenv('CAMERA_TRACKER_IOU_THRESHOLD', '0.3')),
+    'TRACKER_MAX_MISSED': int(os.getenv('CAMERA_TRACKER_MAX_MISSED', '3')),
+    # Box chỉ hiện khi detector đã thấy mèo N lần liên tiếp gần đây (lọc false positive lẻ)
+    'TRACKER_MIN_HITS': int(os.getenv('CAMERA_TRACKER_MIN_HITS', '2')),
+    # Mặc định cho client mới: server vẽ box vào frame; client: gửi frame gốc + detections để tự vẽ
+    # (dashboard luôn chọn client bằng lệnh set_overlay_mode)
+    'STREAM_OVERLAY_MODE': os.getenv('CAMERA_STREAM_OVERLAY_MODE', 'server'),
+    # FPS tối đa gửi cho mỗi client WebSocket (0 = theo tốc độ camera)
+    'STREAM_MAX_FPS': float(os.getenv('CAMERA_STREAM_MAX_FPS', '15')),
+    # Bậc chất lượng 'tỉ lệ:jpeg quality:fps tối đa,...' (trống = mặc định), client chậm tự xuống bậc thấp hơn
+    'QUALITY_LADDER': os.getenv('CAMERA_QUALITY_LADDER', ''),
+    # Byte / frame đã gửi mà client chưa ack, vượt thì bỏ frame
+    'STREAM_MAX_OUTSTANDING_BYTES': int(os.getenv('CAMERA_STREAM_MAX_OUTSTANDING_BYTES', str(512 * 1024))),
+    'STREAM_MAX_OUTSTANDING_FRAMES': int(os.getenv('CAMERA_STREAM_MAX_OUTSTANDING_FRAMES', '3')),
+    # Camera gần như đứng yên: bỏ frame không đổi, chỉ gửi tile đã đổi, keyframe đầy đủ mỗi N giây
+    # (KEYFRAME_INTERVAL phải nhỏ hơn 10 giây để client không báo mất hình khi cảnh tĩnh)
+    'STREAM_DELTA_ENABLED': str_to_bool(os.getenv('CAMERA_STREAM_DELTA_ENABLED', 'False')),
+    'STREAM_DELTA_TILE_SIZE': int(os.getenv('CAMERA_STREAM_DELTA_TILE_SIZE', '64')),
+    'STREAM_DELTA_PIXEL_DELTA': int(os.getenv('CAMERA_STREAM_DELTA_PIXEL_DELTA', '12')),
+    'STREAM_DELTA_MAX_CHANGED_RATIO': float(os.getenv('CAMERA_STREAM_DELTA_MAX_CHANGED_RATIO', '0.4')),
+    'STREAM_DELTA_KEYFRAME_INTERVAL': float(os.getenv('CAMERA_STREAM_DELTA_KEYFRAME_INTERVAL', '5')),
+    # /video-feed/: mọi client dùng chung camera session, trả session sau N giây không còn ai xem
+    'RELAY_IDLE_GRACE_SECONDS': float(os.getenv('CAMERA_RELAY_IDLE_GRACE_SECONDS', '10')),
+    'RELAY_BUFFER_SIZE': int(os.getenv('CAMERA_RELAY_BUFFER_SIZE', '2')),
+    # Capture RTSP dùng chung: giữ thêm N giây sau khi client cuối rời đi, reconnect với backoff + jitter
+    'SESSION_IDLE_GRACE_SECONDS': float(os.getenv('CAMERA_SESSION_IDLE_GRACE_SECONDS', '15')),
+    'RECONNECT_BACKOFF_INITIAL': float(os.getenv('CAMERA_RECONNECT_BACKOFF_INITIAL', '0.5')),
+    'RECONNECT_BACKOFF_MAX': float(os.getenv('CAMERA_RECONNECT_BACKOFF_MAX', '10')),
+    'RECONNECT_BACKOFF_JITTER': float(os.getenv('CAMERA_RECONNECT_BACKOFF_JITTER', '0.3')),
+    # Số frame gần nhất giữ trong ring buffer của mỗi camera
+    'FRAME_BUFFER_SIZE': int(os.getenv('CAMERA_FRAME_BUFFER_SIZE', '30')),
+    # /api/snapshot/: ảnh mới nhất từ bộ nhớ (ETag/Last-Modified), thumbnail tạo một lần mỗi frame
+    # Frame cũ hơn MAX_STALE_SECONDS khi không ai xem thì mở capture lấy frame mới
+    'SNAPSHOT_THUMBNAIL_WIDTH': int(os.getenv('CAMERA_SNAPSHOT_THUMBNAIL_WIDTH', '320')),
+    'SNAPSHOT_THUMBNAIL_QUALITY': int(os.getenv('CAMERA_SNAPSHOT_THUMBNAIL_QUALITY', '70')),
+    'SNAPSHOT_MAX_STALE_SECONDS': float(os.getenv('CAMERA_SNAPSHOT_MAX_STALE_SECONDS', '2')),
+    # max_age tối đa client được yêu cầu (?max_age=N -> Cache-Control: max-age=N)
+    'SNAPSHOT_MAX_AGE': int(os.getenv('CAMERA_SNAPSHOT_MAX_AGE', '10')),
 }
 
+# Nguồn frame của từng camera: http (MJPEG) | rtsp | file | synthetic
+# URL trống thì dùng http://ESP32_IP/stream hoặc rtsp://ESP32_IP:8554/
+# Chỉ http có sẵn JPEG của camera để gửi thẳng (stream, /video-feed/, DVR, snapshot);
+# rtsp/file/synthetic phải decode rồi encode lại JPEG cho mỗi frame
+CAMERA_SOURCES = {
+    'default': {
+        'TYPE': os.getenv('CAMERA_SOURCE_TYPE', 'http'),
+        'URL': os.getenv('CAMERA_SOURCE_URL', ''),
+        'PATH': os.getenv('CAMERA_SOURCE_PATH', ''),
+        'FPS': float(os.getenv('CAMERA_SOURCE_FPS', '0')) or None,
+    },
+}
+
+# Ghi hình (DVR): segment JPEG nối tiếp + index mmap trên đĩa, xoá segment cũ theo dung lượng/số ngày
+# Lịch sử cho ăn / phát hiện bệnh xem lại clip từ CLIP_BEFORE_SECONDS trước tới CLIP_AFTER_SECONDS sau sự kiện
+RECORDING_SETTINGS = {
+    'ENABLED': str_to_bool(os.getenv('RECORDING_ENABLED', 'False')),
+    'DIR': os.getenv('RECORDING_DIR', str(BASE_DIR / 'recordings')),
+    'SEGMENT_SECONDS': int(os.getenv('RECORDING_SEGMENT_SECONDS', '60')),
+    'FPS': float(os.getenv('RECORDING_FPS', '5')),
+    'JPEG_QUALITY': int(os.getenv('RECORDING_JPEG_QUALITY', '80')),
+    'MAX_BYTES': int(os.getenv('RECORDING_MAX_BYTES', str(2 * 1024 ** 3))),
+    'MAX_DAYS': float(os.getenv('RECORDING_MAX_DAYS', '7')),
+    'CLIP_BEFORE_SECONDS': float(os.getenv('RECORDING_CLIP_BEFORE_SECONDS', '10')),
+    'CLIP_AFTER_SECONDS': float(os.getenv('RECORDING_CLIP_AFTER_SECONDS', '30')),
+    'MAX_CLIP_SECONDS': float(os.getenv('RECORDING_MAX_CLIP_SECONDS', '600')),
+}
+
+INFERENCE_SETTINGS = {
+    'MAX_BATCH_SIZE': int(os.getenv('INFERENCE_MAX_BATCH_SIZE', '8')),
+    'MAX_WAIT_MS': float(os.getenv('INFERENCE_MAX_WAIT_MS', '5')),
+    # Thời gian tối đa (giây) detector chờ kết quả inference
+    'PREDICT_TIMEOUT': float(os.getenv('INFERENCE_PREDICT_TIMEOUT', '30')),
+    # Cache kết quả bệnh theo track/crop, chỉ chạy lại disease model khi crop đổi đáng kể
+    'DISEASE_CACHE_SIZE': int(os.getenv('DISEASE_CACHE_SIZE', '64')),
+    'DISEASE_CACHE_TTL': float(os.getenv('DISEASE_CACHE_TTL', '60')),
+    'DISEASE_CACHE_MAX_HASH_DISTANCE': int(os.getenv('DISEASE_CACHE_MAX_HASH_DISTANCE', '6')),
+    # > 0: chạy model trong các process riêng, frame truyền qua shared memory
+    'WORKER_PROCESSES': int(os.getenv('INFERENCE_WORKER_PROCESSES', '0')),
+    'WORKER_SLOTS': int(os.getenv('INFERENCE_WORKER_SLOTS', '16')),
+    'WORKER_SLOT_BYTES': int(os.getenv('INFERENCE_WORKER_SLOT_BYTES', str(1280 * 720 * 3))),
+    # Ảnh cho detection thu nhỏ 1/2, 1/4, 1/8 (decode thu nhỏ từ JPEG nếu có) miễn cạnh dài >= DETECT_MIN_SIZE
+    # (0 = MODEL_SETTINGS IMGSZ // 2), box tự đổi về toạ độ ảnh gốc
+    # Với mặc định frame 640x480 / 800x600 được decode 1/2; đặt bằng IMGSZ để chỉ bỏ pixel dư
+    'DETECT_MAX_DOWNSCALE': int(os.getenv('INFERENCE_DETECT_MAX_DOWNSCALE', '4')),
+    'DETECT_MIN_SIZE': int(os.getenv('INFERENCE_DETECT_MIN_SIZE', '0')),
+}
+MODEL_SETTINGS = {
+    # Backend cho từng model: ultralytics (file .pt), onnx hoặc openvino (export và cache cạnh file .pt)
+    # QUANTIZE: none | dynamic | static - chỉ bật sau khi benchmark_models xác nhận độ chính xác
+    'CAT': {
+        'BACKEND': os.getenv('CAT_MODEL_BACKEND', 'ultralytics'),
+        'QUANTIZE': os.getenv('CAT_MODEL_QUANTIZE', 'none'),
+    },
+    'DISEASE': {
+        'BACKEND': os.getenv('DISEASE_MODEL_BACKEND', 'ultralytics'),
+        'QUANTIZE': os.getenv('DISEASE_MODEL_QUANTIZE', 'none'),
+    },
+    'IMGSZ': int(os.getenv('MODEL_IMGSZ', '640')),
+    'THREADS': int(os.getenv('MODEL_THREADS', '0')),
+    'CALIBRATION_DIR': os.getenv('MODEL_CALIBRATION_DIR', str(BASE_DIR / 'calibration_frames')),
+}
 
 ESP32_IP = os.getenv('ESP32_IP', '192.168.91.97')
 
@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.utils.html import format_html
 from .models import FeedingSchedule, FeedingLog, SystemSettings, DiseaseDetection
+from .recorder import get_recorder
 
 
 @admin.register(FeedingSchedule)
@@ -26,7 +28,14 @@ class SystemSettingsAdmin(admin.ModelAdmin):
 
 @admin.register(DiseaseDetection)
 class DiseaseDetectionAdmin(admin.ModelAdmin):
-    list_display = ['user', 'timestamp', 'disease_name', 'confidence']
+    list_display = ['user', 'timestamp', 'disease_name', 'confidence', 'clip_link']
     list_filter = ['disease_name', 'timestamp']
     search_fields = ['user__username', 'disease_name']
-    readonly_fields = ['timestamp']
\ No newline at end of file
+    readonly_fields = ['timestamp', 'clip_link']
+    
+    @admin.display(description='Clip')
+    def clip_link(self, obj):
+        """Link xem lại clip DVR quanh lúc phát hiện (khi đang bật ghi hình)"""
+        if obj.pk is None or get_recorder('default') is None:
+            return '-'
+        return format_html('<a href="{}" target="_blank">Xem lại</a>', obj.clip_url)
\ No newline at end of file
@@ -2,6 +2,24 @@ from django.apps import AppConfig
 import threading
 import time
 import os
+import sys
+
+
+SERVER_PROGRAMS = ('daphne', 'uvicorn', 'gunicorn')
+
+
+def is_server_process():
+    """
+    Process đang phục vụ request (daphne / uvicorn / gunicorn / runserver), không phải
+    lệnh quản trị như migrate, shell, benchmark_models
+    """
+    program = sys.argv[0] if sys.argv else ''
+    if any(name in program for name in SERVER_PROGRAMS):
+        return True
+    if sys.argv[1:2] == ['runserver']:
+        # Autoreloader: process cha chỉ theo dõi file, process con (RUN_MAIN=true) mới phục vụ
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+    return False
 
 
 class AppConfig(AppConfig):
@@ -49,4 +67,14 @@ class AppConfig(AppConfig):
         
         scheduler_thread = threading.Thread(target=schedule_checker_thread, daemon=True)
         scheduler_thread.start()
+        
+        if is_server_process():
+            from .recorder import get_recorder
+            try:
+                recorder = get_recorder('default')
+                if recorder is not None:
+                    recorder.start()
+                    print("[APPS] ✅ DVR recorder started")
+            except Exception as e:
+                print(f"[APPS] ❌ DVR recorder failed: {e}")
         print("[APPS] ✅ All initialization completed")
\ No newline at end of file
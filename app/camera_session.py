@@ -0,0 +1,210 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+from .frame_buffer import FrameRingBuffer
+from .frame_sources import create_frame_source, get_io_loop
+
+
+class CameraSession:
+    """
+    Phiên capture dùng chung của một camera, đếm số subscriber đang xem
+    - Subscriber cuối rời đi thì capture vẫn chạy thêm idle_grace_seconds (refresh trang không mất hình)
+    - Mất kết nối thì kết nối lại với exponential backoff + jitter
+    - Ghi lại độ trễ từ lúc mất hình tới frame đầu tiên sau khi kết nối lại
+    Vòng đọc chạy trên event loop chung (get_io_loop), nguồn frame lấy từ source_factory()
+    """
+
+    def __init__(self, camera_id, source_factory, idle_grace_seconds=15, backoff_initial=0.5,
+                 backoff_max=10, backoff_jitter=0.3, frame_interval=0, max_read_failures=10,
+                 buffer_size=30):
+        self.camera_id = camera_id
+        self.source_factory = source_factory
+        self.idle_grace_seconds = idle_grace_seconds
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.backoff_jitter = backoff_jitter
+        self.frame_interval = frame_interval
+        self.max_read_failures = max_read_failures
+
+        # N frame gần nhất, mọi reader (stream, phân tích nhiều frame, chụp ảnh) đọc chung
+        self.frames = FrameRingBuffer(buffer_size)
+        self.subscribers = 0
+        self.state = 'stopped'
+        self.source = None
+        self.frame_count = 0
+        self.connects = 0
+        self.failed_attempts = 0
+        self.reconnect_latencies = deque(maxlen=50)
+
+        self._idle_since = None
+        self._generation = 0
+        self._running_generation = None
+        self._reconnect_requested = threading.Event()
+        self._lost_at = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.subscribers += 1
+            self._idle_since = None
+            if self._running_generation is None:
+                self._generation += 1
+                self._running_generation = self._generation
+                self._lost_at = time.monotonic()
+                asyncio.run_coroutine_threadsafe(self._run(self._generation), get_io_loop())
+
+    def release(self):
+        with self._lock:
+            self.subscribers = max(0, self.subscribers - 1)
+            if not self.subscribers:
+                self._idle_since = time.monotonic()
+
+    def reconnect(self):
+        """Đóng kết nối hiện tại và kết nối lại ngay, bỏ qua backoff"""
+        self._reconnect_requested.set()
+
+    def _stop_if_idle(self, generation):
+        with self._lock:
+            if self._running_generation != generation:
+                # Session đã dừng (hoặc đã có vòng capture mới thay thế)
+                return True
+            if self.subscribers or self._idle_since is None:
+                return False
+            if time.monotonic() - self._idle_since < self.idle_grace_seconds:
+                return False
+            self._running_generation = None
+            self.state = 'stopped'
+            return True
+
+    def _backoff_delay(self):
+        delay = min(self.backoff_max, self.backoff_initial * (2 ** max(0, self.failed_attempts - 1)))
+        return delay * random.uniform(1 - self.backoff_jitter, 1 + self.backoff_jitter)
+
+    async def _wait(self, seconds, generation):
+        """Ngủ nhưng dậy sớm khi có yêu cầu reconnect hoặc hết grace period"""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if self._reconnect_requested.is_set() or self._stop_if_idle(generation):
+                return
+            await asyncio.sleep(min(0.1, max(0, deadline - time.monotonic())))
+
+    async def _run(self, generation):
+        while not self._stop_if_idle(generation):
+            self._reconnect_requested.clear()
+            self.state = 'connecting'
+            source = self.source_factory()
+            print(f"Camera {self.camera_id}: kết nối {source!r}")
+
+            try:
+                opened = await source.open()
+            except Exception as e:
+                print(f"Camera {self.camera_id}: lỗi kết nối {e}")
+                opened = False
+
+            if not opened:
+                await source.close()
+                self.failed_attempts += 1
+                delay = self._backoff_delay()
+                print(f"Không thể mở camera {self.camera_id} (lần {self.failed_attempts}), thử lại sau {delay:.1f}s")
+                self.state = 'backoff'
+                await self._wait(delay, generation)
+                continue
+
+            self.failed_attempts = 0
+            self.connects += 1
+            self.state = 'streaming'
+            self.source = source
+            try:
+                await self._read_frames(source, generation)
+            except Exception as e:
+                print(f"Camera {self.camera_id}: mất kết nối {e}")
+            finally:
+                self.source = None
+                await source.close()
+
+            if self._lost_at is None:
+                self._lost_at = time.monotonic()
+
+        print(f"Đã dừng capture camera {self.camera_id}")
+
+    async def _read_frames(self, source, generation):
+        consecutive_failures = 0
+
+        while not self._reconnect_requested.is_set():
+            if self._stop_if_idle(generation):
+                return
+
+            frame = await source.read()
+            if frame is None:
+                consecutive_failures += 1
+                if consecutive_failures > self.max_read_failures:
+                    return
+                await asyncio.sleep(0.1)
+                continue
+
+            consecutive_failures = 0
+            self.frame_count += 1
+            if self._lost_at is not None:
+                latency = time.monotonic() - self._lost_at
+                self.reconnect_latencies.append(latency)
+                self._lost_at = None
+                print(f"Camera {self.camera_id} có hình sau {latency:.2f}s")
+
+            if source.encoded:
+                self.frames.write(None, time.time(), jpeg=frame)
+            else:
+                self.frames.write(frame, time.time())
+            if self.frame_interval:
+                await asyncio.sleep(self.frame_interval)
+
+    def wait_for_frame(self, timeout=5):
+        """Frame mới nhất của camera, chờ nếu chưa có frame nào (gọi từ thread), None nếu hết timeout"""
+        item = self.frames.wait_for(0, timeout)
+        return item[2] if item else None
+
+    def stats(self):
+        latencies = list(self.reconnect_latencies)
+        return {
+            'state': self.state,
+            'source': repr(self.source) if self.source else None,
+            'subscribers': self.subscribers,
+            'frames': self.frame_count,
+            'connects': self.connects,
+            'failed_attempts': self.failed_attempts,
+            'last_reconnect_latency': latencies[-1] if latencies else None,
+            'avg_reconnect_latency': sum(latencies) / len(latencies) if latencies else None,
+            'max_reconnect_latency': max(latencies) if latencies else None,
+        }
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_camera_session(camera_id='default'):
+    """Session của camera, nguồn frame theo CAMERA_SOURCES[camera_id], dựng ở lần đầu"""
+    with _sessions_lock:
+        session = _sessions.get(camera_id)
+        if session is None:
+            from django.conf import settings
+            camera_settings = getattr(settings, 'CAMERA_SETTINGS', {})
+            source_config = getattr(settings, 'CAMERA_SOURCES', {}).get(camera_id, {'TYPE': 'http'})
+            session = CameraSession(
+                camera_id,
+                lambda: create_frame_source(source_config, settings.ESP32_IP),
+                idle_grace_seconds=camera_settings.get('SESSION_IDLE_GRACE_SECONDS', 15),
+                backoff_initial=camera_settings.get('RECONNECT_BACKOFF_INITIAL', 0.5),
+                backoff_max=camera_settings.get('RECONNECT_BACKOFF_MAX', 10),
+                backoff_jitter=camera_settings.get('RECONNECT_BACKOFF_JITTER', 0.3),
+                buffer_size=camera_settings.get('FRAME_BUFFER_SIZE', 30)
+            )
+            _sessions[camera_id] = session
+        return session
+
+
+def get_camera_sessions_stats():
+    with _sessions_lock:
+        return {camera_id: session.stats() for camera_id, session in _sessions.items()}
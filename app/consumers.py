@@ -1,21 +1,17 @@
 import json
 import asyncio
-import base64
-import cv2
-import numpy as np
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.conf import settings
 import os
-import time
 import logging
 import warnings
-import threading
-import queue
-import subprocess
-import signal
 from concurrent.futures import ThreadPoolExecutor
 from .disease_detector import get_cat_care_detector
+from .camera_session import get_camera_session
+from .jpeg_transform import get_jpeg_transform
+from .stream_broadcaster import get_stream_broadcaster
+from .stream_quality import FlowController
 
 warnings.filterwarnings("ignore")
 logging.getLogger('ultralytics').setLevel(logging.ERROR)
@@ -24,10 +20,6 @@ os.environ['OPENCV_FFMPEG_LOGLEVEL'] = '-8'
 os.environ['OPENCV_LOG_LEVEL'] = 'ERROR'
 
 class VideoStreamConsumer(AsyncWebsocketConsumer):
-    _shared_frame_queue = None
-    _shared_capture_thread = None
-    _shared_streaming = False
-    _connection_lock = threading.Lock()
     
     async def connect(self):
         await self.accept()
@@ -39,278 +31,122 @@ class VideoStreamConsumer(AsyncWebsocketConsumer):
         self.detection_interval = 5 
         self.executor = ThreadPoolExecutor(max_workers=2)
         self.detector = get_cat_care_detector()
+        self.camera_session = get_camera_session('default')
+        self.subscription = None
+        # FPS tối đa gửi cho client này, client có thể hạ xuống bằng lệnh set_max_fps
+        self.server_max_fps = getattr(settings, 'CAMERA_SETTINGS', {}).get('STREAM_MAX_FPS', 15)
+        self.max_fps = self.server_max_fps
+        # Mặc định server vẽ box vào frame, dashboard gửi set_overlay_mode để tự vẽ
+        self.client_overlay = getattr(settings, 'CAMERA_SETTINGS', {}).get('STREAM_OVERLAY_MODE', 'server') == 'client'
         
-        with VideoStreamConsumer._connection_lock:
-            if VideoStreamConsumer._shared_frame_queue is None:
-                VideoStreamConsumer._shared_frame_queue = queue.Queue(maxsize=3)
-            self.frame_queue = VideoStreamConsumer._shared_frame_queue
-            
-            if (VideoStreamConsumer._shared_capture_thread is None or 
-                not VideoStreamConsumer._shared_capture_thread.is_alive()):
-                VideoStreamConsumer._shared_streaming = True
-                esp32_ip = settings.ESP32_IP
-                rtsp_url = f"rtsp://{esp32_ip}:8554/" 
-                VideoStreamConsumer._shared_capture_thread = threading.Thread(
-                    target=self.capture_frames_thread,
-                    args=(rtsp_url,),
-                    daemon=True
-                )
-                VideoStreamConsumer._shared_capture_thread.start()
-        
+        self.subscribe_stream()
         self.stream_task = asyncio.create_task(self.stream_video())
     
+    def subscribe_stream(self):
+        """
+        Đăng ký vào broadcaster của camera: flip/detect/encode chạy một lần trên thread
+        của pipeline cho mọi client, consumer chỉ gửi bytes đã encode
+        Capture của camera được giữ sống khi còn ít nhất một subscriber (và thêm grace period)
+        """
+        self.camera_session.acquire()
+        self.broadcaster = get_stream_broadcaster(
+            'default',
+            lambda: self.camera_session.frames,
+            self.detector,
+            getattr(settings, 'CAMERA_SETTINGS', {})
+        )
+        self.subscription = self.broadcaster.subscribe(self.cat_detection_enabled, self.max_fps, self.client_overlay)
+        
+        # Kiểm soát luồng theo ack của client, client chậm tự xuống bậc chất lượng thấp hơn
+        camera_settings = getattr(settings, 'CAMERA_SETTINGS', {})
+        self.flow = FlowController(
+            len(self.broadcaster.pipeline.ladder),
+            max_outstanding_bytes=camera_settings.get('STREAM_MAX_OUTSTANDING_BYTES', 512 * 1024),
+            max_outstanding_frames=camera_settings.get('STREAM_MAX_OUTSTANDING_FRAMES', 3)
+        )
+    
+    def unsubscribe_stream(self):
+        if getattr(self, 'subscription', None) is not None:
+            self.subscription.close()
+            self.subscription = None
+            self.camera_session.release()
+    
     async def disconnect(self, close_code):
         self.streaming = False
         if hasattr(self, 'stream_task'):
             self.stream_task.cancel()
+        self.unsubscribe_stream()
         if hasattr(self, 'executor'):
             self.executor.shutdown(wait=False)
-        
-        with VideoStreamConsumer._connection_lock:
-            try:
-                if (VideoStreamConsumer._shared_capture_thread and 
-                    VideoStreamConsumer._shared_capture_thread.is_alive()):
-                    VideoStreamConsumer._shared_streaming = False
-                    VideoStreamConsumer._shared_capture_thread.join(timeout=2)
-                    VideoStreamConsumer._shared_capture_thread = None
-                    VideoStreamConsumer._shared_frame_queue = None
-            except:
-                pass
-    
-    def capture_frames_thread(self, rtsp_url):
-        cap = None
-        retry_count = 0
-        max_retries = 5
-        
-        print(f"Bắt đầu kết nối RTSP: {rtsp_url}")
-        time.sleep(2)
-        
-        while VideoStreamConsumer._shared_streaming:
-            try:
-                cap = None
-                
-                backends = [
-                    (cv2.CAP_FFMPEG, "CAP_FFMPEG"),
-                    (cv2.CAP_AVFOUNDATION, "CAP_AVFOUNDATION"),
-                    (cv2.CAP_ANY, "CAP_ANY"),
-                    (cv2.CAP_GSTREAMER, "CAP_GSTREAMER"),
-                ]
-                
-                for backend_id, backend_name in backends:
-                    try:
-                        print(f"Thử kết nối với backend: {backend_name}")
-                        print(f"RTSP URL: {rtsp_url}")
-                        
-                        time.sleep(1)
-                        
-                        cap = cv2.VideoCapture(0)
-                        
-                        if cap.isOpened():
-                            print(f"VideoCapture opened với {backend_name}")
-                            
-                            cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 3000)
-                            cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 3000)
-                            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                            cap.set(cv2.CAP_PROP_FPS, 15) 
-                            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                           
-                            test_ret, test_frame = cap.read()
-                            if test_ret and test_frame is not None:
-                                print(f"Kết nối và đọc frame thành công với {backend_name}")
-                                break
-                            else:
-                                print(f"Không thể đọc frame với {backend_name}")
-                                cap.release()
-                                cap = None
-                        else:
-                            print(f"Không thể mở stream với {backend_name}")
-                            if cap:
-                                cap.release()
-                            cap = None
-                    except Exception as e:
-                        print(f"Lỗi khi thử {backend_name}: {e}")
-                        if cap:
-                            cap.release()
-                        cap = None
-                        time.sleep(0.5)
-                
-                if not cap:
-                    print("Không thể mở RTSP stream với bất kỳ backend nào")
-                    
-                    if not cap:
-                        raise Exception("Cannot open RTSP stream and HTTP fallback failed")
-                
-                print("Đang test đọc frame...")
-                test_success = False
-                for test_attempt in range(5):
-                    print(f"Thử đọc frame lần {test_attempt + 1}/5...")
-                    ret, test_frame = cap.read()
-                    if ret and test_frame is not None:
-                        print(f"Đọc frame thành công! Kích thước: {test_frame.shape}")
-                        test_success = True
-                        break
-                    else:
-                        print(f"Thất bại lần {test_attempt + 1}, đợi 1s...")
-                        time.sleep(1.0) 
-                
-                if not test_success:
-                    print("Không thể đọc frame nào từ RTSP sau 5 lần thử")
-                    raise Exception("Cannot read frames from RTSP")
-                
-                retry_count = 0
-                consecutive_failures = 0
-                frame_count = 0
-                
-                while VideoStreamConsumer._shared_streaming:
-                    ret, frame = cap.read()
-                    
-                    if not ret or frame is None:
-                        consecutive_failures += 1
-                        if consecutive_failures > 10:  
-                            break
-                        time.sleep(0.1)
-                        continue
-                    
-                    consecutive_failures = 0
-                    frame_count += 1
-                   
-                    try:
-                        while not VideoStreamConsumer._shared_frame_queue.empty():
-                            try:
-                                VideoStreamConsumer._shared_frame_queue.get_nowait()
-                            except queue.Empty:
-                                break
-                        
-                        VideoStreamConsumer._shared_frame_queue.put_nowait(frame)
-                        
-                    except queue.Full:
-                        pass
-                    
-                    time.sleep(0.1)  # 10 FPS
-                
-            except Exception as e:
-                error_str = str(e).lower()
-                if 'missing packets' not in error_str and 'rtp timestamps' not in error_str:
-                    print(f"RTSP connection error (attempt {retry_count + 1}/{max_retries}): {e}")
-                    print(f"Error type: {type(e).__name__}")
-                retry_count += 1
-                
-            finally:
-                if cap is not None:
-                    cap.release()
-            
-            if VideoStreamConsumer._shared_streaming and retry_count <= max_retries:
-                retry_delay = min(retry_count * 3, 10)
-                time.sleep(retry_delay)
-            else:
-                break
     
     async def stream_video(self):
-        """Main streaming loop chỉ lấy frames từ shared queue"""
-        import asyncio
-        import time
-        
+        """Main streaming loop chỉ gửi frames đã được broadcaster xử lý xong"""
         await self.send(text_data=json.dumps({
             'type': 'status',
             'message': 'Waiting for RTSP frames...'
         }))
         
-        camera_settings = getattr(settings, 'CAMERA_SETTINGS', {})
-        last_frame_time = time.time()
         connection_notified = False
         
         while self.streaming:
             try:
-                try:
-                    frame = self.frame_queue.get_nowait()
-                    last_frame_time = time.time()
-                    
-                    if not connection_notified:
-                        await self.send(text_data=json.dumps({
-                            'type': 'status',
-                            'message': 'RTSP connected'
-                        }))
-                        connection_notified = True
-                        
-                except queue.Empty:
-                    if time.time() - last_frame_time > 10:
-                        await self.send(text_data=json.dumps({
-                            'type': 'status', 
-                            'message': 'Waiting for RTSP frames...'
-                        }))
-                        last_frame_time = time.time()
-                        connection_notified = False
-                    
-                    await asyncio.sleep(0.1)
-                    continue
-                
-                camera_settings = settings.CAMERA_SETTINGS
-                flip_horizontal = camera_settings.get('FLIP_HORIZONTAL', False)
-                flip_vertical = camera_settings.get('FLIP_VERTICAL', False)
-                rotate_180 = camera_settings.get('ROTATE_180', False)
-                
-                if flip_horizontal:
-                    frame = cv2.flip(frame, 1)
+                stream_frame = await self.subscription.get(timeout=10)
                 
-                if flip_vertical:
-                    frame = cv2.flip(frame, 0)
-                
-                if rotate_180:
-                    frame = cv2.flip(frame, -1)
-                
-                current_time = time.time()
-                cats_detected = []
-                
-                if self.cat_detection_enabled and self.detector.cat_detector.is_available():
-                    # Chỉ vẽ bounding box mèo, không vẽ bệnh tự động
-                    annotated_frame, cats_detected = self.detector.detect_cat_realtime(frame.copy())
-                    frame = annotated_frame
-                
-                should_detect_disease = False
-                
-                if should_detect_disease:
-                    loop = asyncio.get_event_loop()
-                    detection_result = await loop.run_in_executor(
-                        self.executor, 
-                        self.detect_disease_on_frame_sync, 
-                        frame.copy()
-                    )
-                    
-                    if detection_result:
-                        print(f"Sending WebSocket message: {detection_result}") 
-                        await self.send(text_data=json.dumps({
-                            'type': 'disease_detection_result',
-                            **detection_result
-                        }))
-                    
-                    self.last_detection_time = current_time
-                
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                
-                if ret:
-                    img_base64 = base64.b64encode(buffer).decode('utf-8')
-                    
+                if stream_frame is None:
                     await self.send(text_data=json.dumps({
-                        'type': 'video_frame',
-                        'image': img_base64
+                        'type': 'status', 
+                        'message': 'Waiting for RTSP frames...'
                     }))
+                    connection_notified = False
+                    continue
                 
-                await asyncio.sleep(0.1)  # 10 FPS
+                if not connection_notified:
+                    await self.send(text_data=json.dumps({
+                        'type': 'status',
+                        'message': 'RTSP connected'
+                    }))
+                    connection_notified = True
                 
+                frames = self.subscription.with_keyframe(stream_frame)
+                size = sum(len(frame.packet) for frame in frames)
+                if not self.flow.can_send(size):
+                    # Client chưa vẽ kịp các frame trước, bỏ frame này thay vì dồn vào buffer gửi
+                    self.flow.on_dropped()
+                else:
+                    # JPEG/tile + header binary (xem stream_protocol), không base64/JSON
+                    for frame in frames:
+                        await self.send(bytes_data=frame.packet)
+                    self.subscription.mark_sent(stream_frame)
+                    self.flow.on_sent(stream_frame.seq, size)
+                
+                level = self.flow.update()
+                if level != self.subscription.level:
+                    self.broadcaster.set_level(self.subscription, level)
+                
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 print(f"Stream processing error: {e}")
                 await asyncio.sleep(0.5)
     
     def get_current_frame(self):
-        """Lấy frame hiện tại từ queue"""
-        try:
-            if VideoStreamConsumer._shared_frame_queue and not VideoStreamConsumer._shared_frame_queue.empty():
-                frame = VideoStreamConsumer._shared_frame_queue.get_nowait()
-                return frame
-        except queue.Empty:
-            pass
-        return None
+        """Lấy frame mới nhất (đã flip) từ ring buffer của camera, không lấy mất frame của reader khác"""
+        item = self.camera_session.frames.latest()
+        if item is None:
+            return None
+        return get_jpeg_transform().apply_frame(item[2])
+    
+    def get_recent_frames(self, count=10, min_spacing=0.3, timeout=5):
+        """
+        count frame gần nhất (đã flip), cách nhau ít nhất min_spacing giây
+        Chưa có frame nào thì chờ tối đa timeout giây
+        """
+        frames = self.camera_session.frames.last(count, min_spacing)
+        if not frames:
+            item = self.camera_session.frames.wait_for(0, timeout)
+            frames = [item] if item else []
+        jpeg_transform = get_jpeg_transform()
+        return [jpeg_transform.apply_frame(frame) for _, _, frame in frames]
     
     def detect_disease_on_frame_sync(self, frame):
         """Synchronous disease detection để chạy trong thread pool"""
@@ -374,15 +210,9 @@ class VideoStreamConsumer(AsyncWebsocketConsumer):
             }
 
     def detect_disease_multi_frame_sync(self):
-        """Phát hiện bệnh bằng cách phân tích nhiều frame trong 5 giây"""
-        import time
-        from collections import defaultdict
-        
-        print("Bắt đầu phân tích video trong 5 giây...")
-        start_time = time.time()
+        """Phát hiện bệnh bằng cách phân tích các frame gần nhất trong ring buffer của camera"""
         frame_results = []
         frames_analyzed = 0
-        detection_interval = 0.5 
         
         try:
             from django.contrib.auth.models import User
@@ -395,38 +225,31 @@ class VideoStreamConsumer(AsyncWebsocketConsumer):
                     'message': 'Không tìm thấy user'
                 }
             
-            last_analysis_time = 0
+            frames = self.get_recent_frames()
+            print(f"Bắt đầu phân tích {len(frames)} frame gần nhất...")
             
-            while time.time() - start_time < 5.0:
-                current_time = time.time()
-                
-                if current_time - last_analysis_time >= detection_interval:
-                    frame = self.get_current_frame()
-                    if frame is not None:
-                        try:
-                            result = self.detector.detect_diseases_on_frame(frame, user)
-                            if result and result.get('success', False):
-                                frame_results.append(result)
-                                frames_analyzed += 1
-                                diseases_count = len(result.get('diseases', []))
-                                print(f"Frame {frames_analyzed}: {diseases_count} bệnh phát hiện")
-                            
-                            last_analysis_time = current_time
-                            
-                        except Exception as e:
-                            print(f"Lỗi phân tích frame {frames_analyzed + 1}: {e}")
-                
-                time.sleep(0.1)
+            for frame in frames:
+                try:
+                    # Mỗi frame phải là một lần chạy model riêng, cache sẽ trả cùng một kết quả cho mèo đứng yên
+                    result = self.detector.detect_diseases_on_frame(frame, user, use_cache=False)
+                    if result and result.get('success', False):
+                        frame_results.append(result)
+                        frames_analyzed += 1
+                        diseases_count = len(result.get('diseases', []))
+                        print(f"Frame {frames_analyzed}: {diseases_count} bệnh phát hiện")
+                    
+                except Exception as e:
+                    print(f"Lỗi phân tích frame {frames_analyzed + 1}: {e}")
             
             if not frame_results:
                 return {
                     'cat_detected': False,
                     'diseases': [],
                     'total_diseases': 0,
-                    'message': 'Không thể lấy frame nào để phân tích trong 5 giây'
+                    'message': 'Không thể lấy frame nào để phân tích'
                 }
             
-            print(f"Đã phân tích {frames_analyzed} frames trong 5 giây")
+            print(f"Đã phân tích {frames_analyzed} frames")
             return self._aggregate_detection_results(frame_results)
             
         except Exception as e:
@@ -529,32 +352,17 @@ class VideoStreamConsumer(AsyncWebsocketConsumer):
             if command == 'start_stream':
                 if not self.streaming:
                     self.streaming = True
+                    self.subscribe_stream()
                     self.stream_task = asyncio.create_task(self.stream_video())
             
             elif command == 'stop_stream':
                 self.streaming = False
                 if hasattr(self, 'stream_task'):
                     self.stream_task.cancel()
+                self.unsubscribe_stream()
             
             elif command == 'reconnect_camera':
-                with VideoStreamConsumer._connection_lock:
-                    VideoStreamConsumer._shared_streaming = False
-                    if (VideoStreamConsumer._shared_capture_thread and 
-                        VideoStreamConsumer._shared_capture_thread.is_alive()):
-                        VideoStreamConsumer._shared_capture_thread.join(timeout=3)
-                    
-                    VideoStreamConsumer._shared_capture_thread = None
-                    VideoStreamConsumer._shared_frame_queue = queue.Queue(maxsize=3)
-                    VideoStreamConsumer._shared_streaming = True
-                    
-                    esp32_ip = settings.ESP32_IP
-                    rtsp_url = f"rtsp://{esp32_ip}:8554/"
-                    VideoStreamConsumer._shared_capture_thread = threading.Thread(
-                        target=self.capture_frames_thread,
-                        args=(rtsp_url,),
-                        daemon=True
-                    )
-                    VideoStreamConsumer._shared_capture_thread.start()
+                self.camera_session.reconnect()
                 
                 await self.send(text_data=json.dumps({
                     'type': 'status',
@@ -600,8 +408,42 @@ class VideoStreamConsumer(AsyncWebsocketConsumer):
                         'message': 'Phát hiện bệnh chưa được bật'
                     }))
             
+            elif command == 'set_max_fps':
+                try:
+                    fps = float(data.get('fps', 0))
+                except (TypeError, ValueError):
+                    fps = 0
+                
+                # 0 hoặc lớn hơn giới hạn của server thì dùng giới hạn của server
+                if fps > 0 and (not self.server_max_fps or fps < self.server_max_fps):
+                    self.max_fps = fps
+                else:
+                    self.max_fps = self.server_max_fps
+                if self.subscription is not None:
+                    self.subscription.max_fps = self.max_fps
+                await self.send(text_data=json.dumps({
+                    'type': 'status',
+                    'message': f'FPS tối đa: {self.max_fps:g}' if self.max_fps else 'FPS không giới hạn'
+                }))
+            
+            elif command == 'set_overlay_mode':
+                # 'client': nhận frame không vẽ box kèm detections để tự vẽ; 'server': server vẽ box
+                self.client_overlay = data.get('mode') == 'client'
+                if self.subscription is not None:
+                    self.broadcaster.set_client_overlay(self.subscription, self.client_overlay)
+            
+            elif command == 'ack':
+                # Client đã vẽ xong frame seq
+                if self.subscription is not None:
+                    try:
+                        self.flow.on_ack(int(data.get('seq')))
+                    except (TypeError, ValueError):
+                        pass
+            
             elif command == 'toggle_cat_detection':
                 self.cat_detection_enabled = not self.cat_detection_enabled
+                if self.subscription is not None:
+                    self.broadcaster.set_cat_detection(self.subscription, self.cat_detection_enabled)
                 status = 'bật' if self.cat_detection_enabled else 'tắt'
                 await self.send(text_data=json.dumps({
                     'type': 'status',
@@ -0,0 +1,108 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+# libjpeg decode thẳng ra ảnh 1/2, 1/4, 1/8 bằng DCT scaling, không decode full rồi mới resize
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Marker SOF (baseline, progressive, ...) chứa kích thước ảnh, trừ DHT (C4), JPG (C8), DAC (CC)
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(jpeg):
+    """(width, height) đọc từ header SOF, không decode ảnh; None nếu không đọc được"""
+    data = memoryview(jpeg)
+    index = 2
+    while index + 9 <= len(data):
+        if data[index] != 0xFF:
+            return None
+        marker = data[index + 1]
+        if marker == 0xFF:
+            # Byte đệm trước marker
+            index += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height = (data[index + 5] << 8) | data[index + 6]
+            width = (data[index + 7] << 8) | data[index + 8]
+            return width, height
+        if marker == 0xDA:
+            # Tới dữ liệu ảnh mà chưa gặp SOF
+            return None
+        index += 2 + ((data[index + 2] << 8) | data[index + 3])
+    return None
+
+
+class DetectionScaler:
+    """
+    Tạo ảnh cỡ nhỏ riêng cho detection: model tự resize về imgsz nên pixel vượt quá đều bỏ đi
+    - Từ JPEG: decode thu nhỏ 1/2, 1/4, 1/8 ngay lúc decode (ít decode và ít băng thông bộ nhớ hơn 4-64 lần)
+    - Từ frame đã decode: resize INTER_AREA
+    Hệ số tính theo cạnh dài max(width, height) (model letterbox theo cạnh dài), chọn lớn nhất
+    sao cho cạnh dài vẫn >= min_size. min_size mặc định là imgsz // 2 nên frame ESP32 640x480 /
+    800x600 cũng được decode 1/2 (320x240 / 400x300), frame 1280x720 trở lên thu nhỏ tới max_factor;
+    đặt DETECT_MIN_SIZE = imgsz nếu cần giữ chi tiết cho mèo ở xa (chỉ thu nhỏ phần pixel dư)
+    scale trả về là tỉ lệ cạnh dài ảnh gốc / ảnh nhỏ, detector nhân box với scale để về toạ độ ảnh gốc
+    """
+
+    def __init__(self, min_size=320, max_factor=4):
+        self.min_size = int(min_size)
+        self.max_factor = max(1, int(max_factor))
+
+    @classmethod
+    def from_settings(cls, inference_settings, model_settings):
+        return cls(
+            min_size=inference_settings.get('DETECT_MIN_SIZE') or model_settings.get('IMGSZ', 640) // 2,
+            max_factor=inference_settings.get('DETECT_MAX_DOWNSCALE', 4)
+        )
+
+    def factor_for(self, width, height):
+        """Hệ số thu nhỏ (1, 2, 4 hoặc 8) cho ảnh width x height"""
+        longest = max(width, height)
+        for factor in (8, 4, 2):
+            if factor <= self.max_factor and longest // factor >= self.min_size:
+                return factor
+        return 1
+
+    def from_frame(self, frame):
+        """Returns: (ảnh cho detection, scale)"""
+        height, width = frame.shape[:2]
+        factor = self.factor_for(width, height)
+        if factor == 1:
+            return frame, 1.0
+        small = cv2.resize(frame, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+        return small, max(width, height) / max(small.shape[:2])
+
+    def from_jpeg(self, jpeg):
+        """Returns: (ảnh cho detection, scale), (None, 1.0) nếu không decode được"""
+        size = jpeg_size(jpeg)
+        factor = self.factor_for(*size) if size else 1
+        image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), REDUCED_DECODE_FLAGS[factor])
+        if image is None:
+            return None, 1.0
+        if factor == 1:
+            return image, 1.0
+        return image, max(size) / max(image.shape[:2])
+
+
+_detection_scaler = None
+_detection_scaler_lock = threading.Lock()
+
+
+def get_detection_scaler():
+    """Singleton DetectionScaler dựng từ INFERENCE_SETTINGS / MODEL_SETTINGS"""
+    global _detection_scaler
+    if _detection_scaler is None:
+        with _detection_scaler_lock:
+            if _detection_scaler is None:
+                from django.conf import settings
+                _detection_scaler = DetectionScaler.from_settings(
+                    getattr(settings, 'INFERENCE_SETTINGS', {}), getattr(settings, 'MODEL_SETTINGS', {})
+                )
+    return _detection_scaler
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .disease_detector import Detections
+
+
+def crop_hash(image):
+    """Perceptual hash (dHash 64 bit) của ảnh crop, gần như không đổi khi chỉ có nhiễu nhẹ"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class _CacheEntry:
+    __slots__ = ('signature', 'geometry', 'threshold', 'detections', 'created')
+
+    def __init__(self, signature, geometry, threshold, detections):
+        self.signature = signature
+        self.geometry = geometry
+        self.threshold = threshold
+        self.detections = detections
+        self.created = time.monotonic()
+
+
+class DiseaseResultCache:
+    """
+    Cache kết quả disease model theo chữ ký của crop
+    Chữ ký = perceptual hash của crop + hình học của box; chỉ chạy lại model khi crop đổi đáng kể
+    Giới hạn bằng TTL và LRU theo số entry
+    """
+
+    def __init__(self, max_entries=64, ttl_seconds=60, max_hash_distance=6, max_box_change=0.2):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_hash_distance = max_hash_distance
+        # Độ lệch tương đối tối đa của kích thước/tâm box so với lúc cache
+        self.max_box_change = max_box_change
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls, inference_settings):
+        return cls(
+            max_entries=inference_settings.get('DISEASE_CACHE_SIZE', 64),
+            ttl_seconds=inference_settings.get('DISEASE_CACHE_TTL', 60),
+            max_hash_distance=inference_settings.get('DISEASE_CACHE_MAX_HASH_DISTANCE', 6)
+        )
+
+    @staticmethod
+    def _geometry(image, offset):
+        h, w = image.shape[:2]
+        return (offset[0] + w / 2, offset[1] + h / 2, w, h)
+
+    def _matches(self, entry, signature, geometry, threshold, now):
+        if now - entry.created > self.ttl_seconds or entry.threshold != threshold:
+            return False
+        if hamming(entry.signature, signature) > self.max_hash_distance:
+            return False
+
+        cx, cy, w, h = geometry
+        old_cx, old_cy, old_w, old_h = entry.geometry
+        size = max(old_w, old_h, 1)
+        return (abs(w - old_w) / max(old_w, 1) <= self.max_box_change
+                and abs(h - old_h) / max(old_h, 1) <= self.max_box_change
+                and abs(cx - old_cx) / size <= self.max_box_change
+                and abs(cy - old_cy) / size <= self.max_box_change)
+
+    @staticmethod
+    def _rebase(entry, geometry, offset):
+        """Đưa box đã cache về crop hiện tại (crop có thể dịch/co giãn nhẹ)"""
+        detections = entry.detections
+        scale_x = geometry[2] / max(entry.geometry[2], 1)
+        scale_y = geometry[3] / max(entry.geometry[3], 1)
+        boxes = detections.boxes * np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+        return Detections(boxes, detections.scores, detections.class_ids, detections.labels, offset)
+
+    def get(self, image, offset, threshold):
+        """Returns: Detections đã cache (offset theo crop hiện tại) hoặc None"""
+        signature = crop_hash(image)
+        geometry = self._geometry(image, offset)
+        now = time.monotonic()
+
+        with self._lock:
+            for candidate in list(self._entries):
+                entry = self._entries[candidate]
+                if self._matches(entry, signature, geometry, threshold, now):
+                    self._entries.move_to_end(candidate)
+                    self.hits += 1
+                    return self._rebase(entry, geometry, offset)
+
+            self.misses += 1
+            return None
+
+    def put(self, image, offset, threshold, detections):
+        entry = _CacheEntry(crop_hash(image), self._geometry(image, offset), threshold, detections)
+
+        with self._lock:
+            self._next_key += 1
+            key = self._next_key
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            now = time.monotonic()
+            for old_key in [k for k, e in self._entries.items() if now - e.created > self.ttl_seconds]:
+                del self._entries[old_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0
+            }
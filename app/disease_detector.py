@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
 import os
+import threading
+
+from .detection_frames import get_detection_scaler
 
 try:
     from ultralytics import YOLO
@@ -68,96 +71,180 @@ class ModelLoader:
         return YOLO(model_path)
 
 
+class Detections:
+    """
+    Kết quả detect của một frame, lưu dạng mảng NumPy để tạo một lần
+    rồi dùng lại cho mọi bước vẽ/crop/lưu
+    boxes: (N, 4) float32 theo toạ độ của ảnh đưa vào model (đã nhân scale nếu ảnh đó là bản thu nhỏ)
+    offset: (x, y) của ảnh đó trong frame gốc (khác 0 khi ảnh là vùng crop)
+    track_ids: id của CatTracker, -1 nếu box chưa được track
+    """
+    __slots__ = ('boxes', 'scores', 'class_ids', 'labels', 'offset', 'track_ids')
+    
+    def __init__(self, boxes=None, scores=None, class_ids=None, labels=None, offset=(0, 0),
+                 track_ids=None):
+        self.boxes = np.asarray(boxes if boxes is not None else [], dtype=np.float32).reshape(-1, 4)
+        self.scores = np.asarray(scores if scores is not None else [], dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids if class_ids is not None else [], dtype=np.int32).reshape(-1)
+        if labels is None:
+            labels = [''] * len(self.scores)
+        self.labels = np.asarray(labels, dtype=object).reshape(-1)
+        self.offset = (int(offset[0]), int(offset[1]))
+        if track_ids is None:
+            track_ids = np.full(len(self.scores), -1)
+        self.track_ids = np.asarray(track_ids, dtype=np.int32).reshape(-1)
+    
+    @classmethod
+    def from_result(cls, result, confidence_threshold, label_table, offset=(0, 0), scale=1.0):
+        """
+        Lọc theo ngưỡng và map class id -> tên cho toàn bộ box cùng lúc
+        result: RawResult của model backend
+        label_table: mảng NumPy tên class theo class id (tính sẵn một lần)
+        scale: tỉ lệ ảnh gốc / ảnh đưa vào model (xem DetectionScaler)
+        """
+        keep = result.scores >= confidence_threshold
+        boxes, scores, class_ids = result.boxes[keep], result.scores[keep], result.class_ids[keep]
+        if scale != 1:
+            boxes = boxes * np.float32(scale)
+        
+        known = (class_ids >= 0) & (class_ids < len(label_table))
+        labels = np.full(len(class_ids), 'unknown', dtype=object)
+        labels[known] = label_table[class_ids[known]]
+        
+        return cls(boxes, scores, class_ids, labels, offset)
+    
+    def __len__(self):
+        return len(self.scores)
+    
+    def best_index(self):
+        """Index của box có confidence cao nhất, None nếu rỗng"""
+        if not len(self):
+            return None
+        return int(np.argmax(self.scores))
+    
+    def frame_boxes(self):
+        """Box đã cộng offset, theo toạ độ frame gốc, kiểu int"""
+        ox, oy = self.offset
+        return (self.boxes + np.array([ox, oy, ox, oy], dtype=np.float32)).astype(np.int32)
+    
+    def crop_best(self, frame):
+        """
+        Crop box có confidence cao nhất
+        Returns: (cropped_image, (x1, y1)) hoặc (None, None)
+        """
+        index = self.best_index()
+        if index is None:
+            return None, None
+        
+        x1, y1, x2, y2 = self.frame_boxes()[index].tolist()
+        x1, y1 = max(x1, 0), max(y1, 0)
+        cropped = frame[y1:y2, x1:x2]
+        
+        if cropped.size == 0:
+            return None, None
+        
+        return cropped, (x1, y1)
+    
+    def to_cat_list(self):
+        """Định dạng cũ của detect_cats: [{'bbox': [x1, y1, x2, y2], 'confidence': conf, 'track_id': id}]"""
+        return [
+            {'bbox': box, 'confidence': score, 'track_id': track_id if track_id >= 0 else None}
+            for box, score, track_id in zip(
+                self.frame_boxes().tolist(), self.scores.tolist(), self.track_ids.tolist()
+            )
+        ]
+
+
+def _predict_timeout():
+    """Thời gian tối đa chờ kết quả inference, tránh treo thread detect khi worker lỗi"""
+    from django.conf import settings
+    return getattr(settings, 'INFERENCE_SETTINGS', {}).get('PREDICT_TIMEOUT', 30)
+
+
+def _draw_labeled_box(frame, box, label, color, text_color):
+    """Vẽ bounding box và label phía trên box"""
+    x1, y1, x2, y2 = box
+    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+    
+    label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
+    cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
+                 (x1 + label_size[0], y1), color, -1)
+    cv2.putText(frame, label, (x1, y1 - 5), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 2)
+
+
 class CatDetector:
     """Class để detect mèo trong ảnh"""
     
+    # cat.pt chỉ có một class (static/model/cat.yaml)
+    label_table = np.array(['cat'], dtype=object)
+    
     def __init__(self):
         self.model = None
+        self.predict_timeout = _predict_timeout()
         self._load_model()
     
     def _load_model(self):
-        """Load cat detection model"""
+        """Lấy batch runner của cat model từ inference service"""
         try:
             from django.conf import settings
+            from .inference_service import get_inference_service
             model_path = os.path.join(settings.BASE_DIR, 'static', 'model', 'cat.pt')
-            self.model = ModelLoader.load_model(model_path)
+            self.model = get_inference_service().get_runner('cat', model_path)
         except Exception as e:
             print(f"Không thể load cat model: {e}")
             self.model = None
     
-    def detect_cats(self, frame, confidence_threshold=0.5):
+    def detect(self, frame, confidence_threshold=0.5, scale=1.0):
         """
-        Detect mèo trong frame
-        Returns: List of cat bounding boxes [x1, y1, x2, y2, confidence]
+        Chạy cat model đúng một lần cho frame
+        Args:
+            scale: frame là bản thu nhỏ của frame gốc theo tỉ lệ này, box trả về theo toạ độ frame gốc
+        Returns: Detections
         """
         if not self.model:
-            return []
+            return Detections()
         
         try:
-            results = self.model(frame)
-            cats = []
-            
-            for result in results:
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        conf = float(box.conf[0])
-                        if conf >= confidence_threshold:
-                            # Get bounding box coordinates
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            cats.append({
-                                'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                                'confidence': conf
-                            })
-            
-            return cats
+            # Runner gom frame này với frame của các caller khác thành một batch
+            result = self.model.predict(frame, timeout=self.predict_timeout)
+            return Detections.from_result(result, confidence_threshold, self.label_table, scale=scale)
             
         except Exception as e:
             print(f"Lỗi detect mèo: {e}")
-            return []
+            return Detections()
     
-    def crop_cat_from_frame(self, frame, confidence_threshold=0.5):
+    def detect_cats(self, frame, confidence_threshold=0.5):
+        """
+        Detect mèo trong frame
+        Returns: List of cat bounding boxes [x1, y1, x2, y2, confidence]
+        """
+        return self.detect(frame, confidence_threshold).to_cat_list()
+    
+    def crop_cat_from_frame(self, frame, confidence_threshold=0.5, detections=None):
         """
         Crop ảnh mèo từ frame (lấy mèo có confidence cao nhất)
         Returns: cropped_image hoặc None
         """
-        cats = self.detect_cats(frame, confidence_threshold)
-        
-        if not cats:
-            return None
-        
-        # Lấy mèo có confidence cao nhất
-        best_cat = max(cats, key=lambda x: x['confidence'])
-        x1, y1, x2, y2 = best_cat['bbox']
+        if detections is None:
+            detections = self.detect(frame, confidence_threshold)
         
-        # Crop ảnh
-        cropped = frame[y1:y2, x1:x2]
-        
-        if cropped.size == 0:
-            return None
-            
+        cropped, _ = detections.crop_best(frame)
         return cropped
     
-    def draw_cat_boxes(self, frame, confidence_threshold=0.5):
+    def draw_cat_boxes(self, frame, confidence_threshold=0.5, detections=None):
         """
         Vẽ bounding box của mèo lên frame
         Returns: frame with bounding boxes
         """
-        cats = self.detect_cats(frame, confidence_threshold)
+        if detections is None:
+            detections = self.detect(frame, confidence_threshold)
         
-        for cat in cats:
-            x1, y1, x2, y2 = cat['bbox']
-            confidence = cat['confidence']
-            
-            # Vẽ bounding box
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            # Vẽ label
-            label = f"Cat: {confidence:.2f}"
-            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-            cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                         (x1 + label_size[0], y1), (0, 255, 0), -1)
-            cv2.putText(frame, label, (x1, y1 - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+        for box, confidence, track_id in zip(
+            detections.frame_boxes().tolist(), detections.scores.tolist(), detections.track_ids.tolist()
+        ):
+            label = f"Cat #{track_id}: {confidence:.2f}" if track_id >= 0 else f"Cat: {confidence:.2f}"
+            _draw_labeled_box(frame, box, label, (0, 255, 0), (0, 0, 0))
         
         return frame
     
@@ -185,72 +272,100 @@ class DiseaseDetector:
             'class_4': 'Nấm tròn',
             'class_5': 'Ghẻ sarcoptic'
         }
+        self._label_table = None
+        self._label_names = None
+        self.predict_timeout = _predict_timeout()
         self._load_model()
     
     def _load_model(self):
-        """Load disease detection model"""
+        """Lấy batch runner của disease model từ inference service"""
         try:
             from django.conf import settings
+            from .inference_service import get_inference_service
             model_path = os.path.join(settings.BASE_DIR, 'static', 'model', 'cat-detect.pt')
-            self.model = ModelLoader.load_model(model_path)
+            self.model = get_inference_service().get_runner('disease', model_path)
         except Exception as e:
             print(f"Không thể load disease model: {e}")
             self.model = None
     
-    def detect_diseases(self, image, confidence_threshold=0.5):
+    def detect(self, image, confidence_threshold=0.5, offset=(0, 0), scale=1.0):
+        """
+        Chạy disease model đúng một lần cho ảnh (raise nếu model lỗi)
+        Args:
+            offset: vị trí của ảnh trong frame gốc nếu ảnh là vùng crop
+            scale: ảnh là bản thu nhỏ theo tỉ lệ này, box trả về theo toạ độ ảnh gốc
+        Returns: Detections với labels là tên bệnh tiếng Anh
+        """
+        result = self.model.predict(image, timeout=self.predict_timeout)
+        return Detections.from_result(
+            result, confidence_threshold, self._get_label_table(result), offset, scale
+        )
+    
+    def _get_label_table(self, result):
+        """
+        Bảng class id -> tên bệnh tiếng Anh, chỉ build lại khi model đổi names
+        Ưu tiên result.names, fallback theo thứ tự key của class_names
+        """
+        names = getattr(result, 'names', None) or {}
+        # So theo nội dung: result mới (hoặc dict rỗng mới tạo) mỗi lần predict nên không so identity được
+        key = tuple(sorted(names.items()))
+        if self._label_table is None or self._label_names != key:
+            fallback = list(self.class_names.keys())
+            size = max([len(fallback)] + [int(k) + 1 for k in names])
+            table = [
+                names[i] if i in names else (fallback[i] if i < len(fallback) else 'unknown')
+                for i in range(size)
+            ]
+            self._label_table = np.array(table, dtype=object)
+            self._label_names = key
+        return self._label_table
+    
+    def to_disease_list(self, detections):
+        """Chuyển Detections sang định dạng dict cũ (bbox theo toạ độ ảnh đưa vào model)"""
+        return [
+            {
+                'disease_en': disease_en,
+                'disease_vn': self.class_names.get(disease_en, disease_en),
+                'confidence': conf * 100,
+                'bbox': bbox
+            }
+            for disease_en, conf, bbox in zip(
+                detections.labels, detections.scores.tolist(), detections.boxes.tolist()
+            )
+        ]
+    
+    def detect_diseases(self, image, confidence_threshold=0.5, detections=None):
         """
         Detect bệnh trong ảnh
         Args:
             image: numpy array (OpenCV image) hoặc bytes
             confidence_threshold: ngưỡng confidence
+            detections: Detections đã có sẵn thì không chạy lại model
         Returns: dict với thông tin bệnh
         """
-        if not self.model:
+        if detections is None and not self.model:
             return {
                 'success': False,
                 'message': 'Disease model không khả dụng'
             }
         
         try:
-            # Xử lý input image
-            if isinstance(image, bytes):
-                nparr = np.frombuffer(image, np.uint8)
-                img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            else:
-                img = image
+            if detections is None:
+                # Xử lý input image, JPEG lớn được decode thu nhỏ luôn (box vẫn theo ảnh gốc)
+                if isinstance(image, bytes):
+                    img, scale = get_detection_scaler().from_jpeg(image)
+                else:
+                    img, scale = image, 1.0
+                    
+                if img is None:
+                    return {
+                        'success': False,
+                        'message': 'Không thể decode ảnh'
+                    }
                 
-            if img is None:
-                return {
-                    'success': False,
-                    'message': 'Không thể decode ảnh'
-                }
+                detections = self.detect(img, confidence_threshold, scale=scale)
             
-            results = self.model(img)
-            diseases = []
-            
-            for result in results:
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        cls_id = int(box.cls[0])
-                        conf = float(box.conf[0])
-                        
-                        if conf >= confidence_threshold:
-                            # Get class name
-                            if hasattr(result, 'names') and cls_id in result.names:
-                                disease_en = result.names[cls_id]
-                            else:
-                                disease_en = list(self.class_names.keys())[cls_id] if cls_id < len(self.class_names) else 'unknown'
-                            
-                            disease_vn = self.class_names.get(disease_en, disease_en)
-                            bbox = box.xyxy[0].tolist()
-                            
-                            disease_data = {
-                                'disease_en': disease_en,
-                                'disease_vn': disease_vn,
-                                'confidence': conf * 100,
-                                'bbox': bbox
-                            }
-                            diseases.append(disease_data)
+            diseases = self.to_disease_list(detections)
             
             return {
                 'success': True,
@@ -264,55 +379,53 @@ class DiseaseDetector:
                 'message': f'Lỗi phân tích: {str(e)}'
             }
     
-    def detect_diseases_and_save(self, image_data, user, confidence_threshold=0.5):
+    def save_diseases(self, result, user):
+        """Lưu các bệnh trong kết quả của detect_diseases vào database"""
+        if not result['success']:
+            return
+        
+        try:
+            from .models import DiseaseDetection
+            for disease_data in result['diseases']:
+                DiseaseDetection.objects.create(
+                    user=user,
+                    disease_name=disease_data['disease_en'],
+                    confidence=disease_data['confidence'] / 100,
+                    bbox_x1=disease_data['bbox'][0],
+                    bbox_y1=disease_data['bbox'][1], 
+                    bbox_x2=disease_data['bbox'][2],
+                    bbox_y2=disease_data['bbox'][3]
+                )
+        except Exception as e:
+            print(f"Lỗi lưu database: {e}")
+    
+    def detect_diseases_and_save(self, image_data, user, confidence_threshold=0.5, detections=None):
         """
         Detect bệnh và lưu vào database
         """
-        result = self.detect_diseases(image_data, confidence_threshold)
-        
-        if result['success']:
-            try:
-                from .models import DiseaseDetection
-                for disease_data in result['diseases']:
-                    DiseaseDetection.objects.create(
-                        user=user,
-                        disease_name=disease_data['disease_en'],
-                        confidence=disease_data['confidence'] / 100,
-                        bbox_x1=disease_data['bbox'][0],
-                        bbox_y1=disease_data['bbox'][1], 
-                        bbox_x2=disease_data['bbox'][2],
-                        bbox_y2=disease_data['bbox'][3]
-                    )
-            except Exception as e:
-                print(f"Lỗi lưu database: {e}")
-        
+        result = self.detect_diseases(image_data, confidence_threshold, detections=detections)
+        self.save_diseases(result, user)
         return result
     
-    def draw_disease_boxes(self, frame, confidence_threshold=0.5):
+    def draw_disease_boxes(self, frame, confidence_threshold=0.5, detections=None):
         """
         Vẽ bounding box của bệnh lên frame
+        Nếu detections được detect trên vùng crop, offset của nó đưa box về frame gốc
         Returns: frame with disease bounding boxes
         """
-        result = self.detect_diseases(frame, confidence_threshold)
-        
-        if not result['success']:
-            return frame
+        if detections is None:
+            try:
+                detections = self.detect(frame, confidence_threshold)
+            except Exception:
+                return frame
         
-        for disease in result['diseases']:
-            x1, y1, x2, y2 = [int(coord) for coord in disease['bbox']]
-            confidence = disease['confidence']
-            disease_name = disease['disease_vn']
-            
+        for box, confidence, disease_en in zip(
+            detections.frame_boxes().tolist(), detections.scores.tolist(), detections.labels
+        ):
+            disease_name = self.class_names.get(disease_en, disease_en)
             # Vẽ bounding box với màu đỏ cho bệnh
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-            
-            # Vẽ label
-            label = f"{disease_name}: {confidence:.1f}%"
-            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-            cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                         (x1 + label_size[0], y1), (0, 0, 255), -1)
-            cv2.putText(frame, label, (x1, y1 - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+            _draw_labeled_box(frame, box, f"{disease_name}: {confidence * 100:.1f}%",
+                              (0, 0, 255), (255, 255, 255))
         
         return frame
     
@@ -324,8 +437,34 @@ class CatCareDetector:
     """Main class kết hợp cat detection và disease detection"""
     
     def __init__(self):
+        from django.conf import settings
+        from .disease_cache import DiseaseResultCache
         self.cat_detector = CatDetector()
         self.disease_detector = DiseaseDetector()
+        self.disease_cache = DiseaseResultCache.from_settings(
+            getattr(settings, 'INFERENCE_SETTINGS', {})
+        )
+    
+    def _detect_best_cat_diseases(self, frame, cats, confidence_threshold, use_cache=True):
+        """
+        Detect bệnh trên crop của con mèo có confidence cao nhất, dùng cache khi crop
+        gần như không đổi (cùng chữ ký ảnh + hình học của box)
+        use_cache=False: luôn chạy model (phân tích nhiều frame cần kết quả độc lập cho từng frame)
+        Returns: Detections (offset theo frame gốc) hoặc None nếu không crop được
+        """
+        cat_image, crop_offset = cats.crop_best(frame)
+        if cat_image is None:
+            return None
+        
+        if not use_cache:
+            return self.disease_detector.detect(cat_image, confidence_threshold, offset=crop_offset)
+        
+        diseases = self.disease_cache.get(cat_image, crop_offset, confidence_threshold)
+        if diseases is None:
+            diseases = self.disease_detector.detect(cat_image, confidence_threshold, offset=crop_offset)
+            self.disease_cache.put(cat_image, crop_offset, confidence_threshold, diseases)
+        
+        return diseases
     
     def detect_cat_realtime(self, frame, confidence_threshold=0.5):
         """
@@ -334,10 +473,10 @@ class CatCareDetector:
         if not self.cat_detector.is_available():
             return frame, []
         
-        cats = self.cat_detector.detect_cats(frame, confidence_threshold)
-        annotated_frame = self.cat_detector.draw_cat_boxes(frame.copy(), confidence_threshold)
+        cats = self.cat_detector.detect(frame, confidence_threshold)
+        annotated_frame = self.cat_detector.draw_cat_boxes(frame.copy(), detections=cats)
         
-        return annotated_frame, cats
+        return annotated_frame, cats.to_cat_list()
     
     def detect_cat_and_disease_realtime(self, frame, confidence_threshold=0.5):
         """
@@ -346,50 +485,24 @@ class CatCareDetector:
         if not self.cat_detector.is_available():
             return frame, []
         
-        cats = self.cat_detector.detect_cats(frame, confidence_threshold)
+        cats = self.cat_detector.detect(frame, confidence_threshold)
         
         # Vẽ bounding box mèo (màu xanh)
-        annotated_frame = self.cat_detector.draw_cat_boxes(frame.copy(), confidence_threshold)
+        annotated_frame = self.cat_detector.draw_cat_boxes(frame.copy(), detections=cats)
         
         # Nếu có mèo và disease detector available, vẽ thêm bounding box bệnh
-        if cats and self.disease_detector.is_available():
-            # Crop mèo có confidence cao nhất
-            best_cat = max(cats, key=lambda x: x['confidence'])
-            x1, y1, x2, y2 = best_cat['bbox']
-            cat_image = frame[y1:y2, x1:x2]
-            
-            if cat_image.size > 0:
-                # Detect bệnh trên cropped image
-                disease_result = self.disease_detector.detect_diseases(cat_image, confidence_threshold)
-                
-                if disease_result['success'] and disease_result['diseases']:
-                    # Vẽ bounding box bệnh trên cropped area (màu đỏ)
-                    for disease in disease_result['diseases']:
-                        # Adjust coordinates to original frame
-                        dx1, dy1, dx2, dy2 = [int(coord) for coord in disease['bbox']]
-                        # Convert từ coordinate trong crop về coordinate trong frame gốc
-                        orig_x1 = x1 + dx1
-                        orig_y1 = y1 + dy1
-                        orig_x2 = x1 + dx2
-                        orig_y2 = y1 + dy2
-                        
-                        confidence = disease['confidence']
-                        disease_name = disease['disease_vn']
-                        
-                        # Vẽ bounding box bệnh (màu đỏ)
-                        cv2.rectangle(annotated_frame, (orig_x1, orig_y1), (orig_x2, orig_y2), (0, 0, 255), 2)
-                        
-                        # Vẽ label bệnh
-                        label = f"{disease_name}: {confidence:.1f}%"
-                        label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
-                        cv2.rectangle(annotated_frame, (orig_x1, orig_y1 - label_size[1] - 10), 
-                                     (orig_x1 + label_size[0], orig_y1), (0, 0, 255), -1)
-                        cv2.putText(annotated_frame, label, (orig_x1, orig_y1 - 5), 
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        return annotated_frame, cats
-    
-    def detect_diseases_on_frame(self, frame, user, confidence_threshold=0.5):
+        if len(cats) and self.disease_detector.is_available():
+            try:
+                # Detect bệnh trên crop mèo có confidence cao nhất, offset đưa box về frame gốc
+                diseases = self._detect_best_cat_diseases(frame, cats, confidence_threshold)
+                if diseases is not None:
+                    self.disease_detector.draw_disease_boxes(annotated_frame, detections=diseases)
+            except Exception as e:
+                print(f"Lỗi detect bệnh realtime: {e}")
+        
+        return annotated_frame, cats.to_cat_list()
+    
+    def detect_diseases_on_frame(self, frame, user, confidence_threshold=0.5, use_cache=True):
         """
         Phát hiện bệnh trên frame:
         1. Detect mèo từ frame (lấy confidence thực tế)
@@ -402,21 +515,30 @@ class CatCareDetector:
                 'message': 'Models không khả dụng'
             }
         
-        cats = self.cat_detector.detect_cats(frame, confidence_threshold)
+        # Detect mèo trên bản thu nhỏ, crop bệnh vẫn lấy từ frame đầy đủ
+        detect_frame, scale = get_detection_scaler().from_frame(frame)
+        cats = self.cat_detector.detect(detect_frame, confidence_threshold, scale=scale)
         
-        if not cats:
+        if not len(cats):
             return {
                 'success': False,
                 'message': 'Không phát hiện mèo trong ảnh'
             }
         
-        best_cat = max(cats, key=lambda x: x['confidence'])
-        cat_confidence = best_cat['confidence']
+        cat_confidence = float(cats.scores[cats.best_index()])
         
-        x1, y1, x2, y2 = best_cat['bbox']
-        cat_image = frame[y1:y2, x1:x2]
+        try:
+            diseases = self._detect_best_cat_diseases(frame, cats, confidence_threshold, use_cache)
+        except Exception as e:
+            return {
+                'success': False,
+                'message': f'Lỗi phân tích: {str(e)}',
+                'cat_detected': True,
+                'cat_cropped': True,
+                'cat_confidence': cat_confidence * 100
+            }
         
-        if cat_image.size == 0:
+        if diseases is None:
             return {
                 'success': False,
                 'message': 'Không thể crop ảnh mèo',
@@ -425,7 +547,7 @@ class CatCareDetector:
             }
         
         disease_result = self.disease_detector.detect_diseases_and_save(
-            cat_image, user, confidence_threshold
+            None, user, confidence_threshold, detections=diseases
         )
         
         if disease_result['success']:
@@ -448,24 +570,31 @@ class CatCareDetector:
 _cat_care_detector = None
 _cat_detector = None
 _disease_detector = None
+_singleton_lock = threading.Lock()
 
 def get_cat_care_detector():
     """Singleton pattern cho main detector"""
     global _cat_care_detector
     if _cat_care_detector is None:
-        _cat_care_detector = CatCareDetector()
+        with _singleton_lock:
+            if _cat_care_detector is None:
+                _cat_care_detector = CatCareDetector()
     return _cat_care_detector
 
 def get_cat_detector():
     """Singleton pattern cho cat detector"""
     global _cat_detector
     if _cat_detector is None:
-        _cat_detector = CatDetector()
+        with _singleton_lock:
+            if _cat_detector is None:
+                _cat_detector = CatDetector()
     return _cat_detector
 
 def get_disease_detector():
     """Singleton pattern cho disease detector"""
     global _disease_detector
     if _disease_detector is None:
-        _disease_detector = DiseaseDetector()
-    return _disease_detector 
\ No newline at end of file
+        with _singleton_lock:
+            if _disease_detector is None:
+                _disease_detector = DiseaseDetector()
+    return _disease_detector
\ No newline at end of file
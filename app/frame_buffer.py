@@ -0,0 +1,140 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameRingBuffer:
+    """
+    Ring buffer N frame gần nhất của một camera, bộ nhớ cấp phát sẵn (cấp lại khi đổi kích thước frame)
+    Mỗi frame có seq tăng dần (bắt đầu từ 1) và thời điểm capture
+    Đọc không lấy mất frame: nhiều reader cùng đọc, reader có thể chờ frame có seq mới hơn
+    Frame trả về là bản copy, writer ghi đè slot cũ không ảnh hưởng reader
+    Nguồn có sẵn JPEG (HTTP MJPEG) chỉ lưu bytes JPEG: frame đầy đủ decode lần đầu có reader cần
+    (ngoài lock, kết quả giữ lại trong slot); reader chỉ cần JPEG (stream, DVR, detection thu nhỏ)
+    đọc với decode=False nên không tốn decode full frame
+    """
+
+    def __init__(self, capacity=30):
+        self.capacity = int(capacity)
+        self.seq = 0
+        self._slots = None
+        self._seqs = np.zeros(self.capacity, dtype=np.int64)
+        self._timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self._decoded = np.zeros(self.capacity, dtype=bool)
+        self._jpegs = [None] * self.capacity
+        self._condition = threading.Condition()
+
+    def _allocate(self, frame):
+        """Cấp lại slot theo kích thước frame mới, slot không có JPEG để decode lại thì mất"""
+        if self._slots is not None and self._slots.shape[1:] == frame.shape and self._slots.dtype == frame.dtype:
+            return
+        self._slots = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+        for index, jpeg in enumerate(self._jpegs):
+            if jpeg is None:
+                self._seqs[index] = 0
+        self._decoded[:] = False
+
+    def write(self, frame, timestamp=None, jpeg=None):
+        """
+        frame: BGR hoặc None nếu chỉ có JPEG (decode khi có reader cần)
+        Returns: seq của frame vừa ghi
+        """
+        with self._condition:
+            self.seq += 1
+            index = self.seq % self.capacity
+            if frame is not None:
+                self._allocate(frame)
+                np.copyto(self._slots[index], frame)
+            self._decoded[index] = frame is not None
+            self._seqs[index] = self.seq
+            self._timestamps[index] = timestamp if timestamp is not None else time.time()
+            self._jpegs[index] = jpeg
+            self._condition.notify_all()
+            return self.seq
+
+    def _read(self, seq, decode):
+        """Gọi khi giữ lock: (seq, timestamp, frame copy, None) hoặc (seq, timestamp, None, jpeg) nếu chưa decode"""
+        index = seq % self.capacity
+        if self._seqs[index] != seq:
+            return None
+        timestamp = float(self._timestamps[index])
+        if not decode:
+            return seq, timestamp, None, None
+        if self._decoded[index]:
+            return seq, timestamp, self._slots[index].copy(), None
+        return seq, timestamp, None, self._jpegs[index]
+
+    def _finish(self, item):
+        """Gọi ngoài lock: decode JPEG nếu slot chưa có frame, Returns: (seq, timestamp, frame) hoặc None"""
+        if item is None:
+            return None
+        seq, timestamp, frame, jpeg = item
+        if jpeg is not None:
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                return None
+            with self._condition:
+                index = seq % self.capacity
+                if self._slots is None:
+                    self._allocate(frame)
+                # Khác kích thước slot hiện tại (nguồn vừa đổi độ phân giải): không giữ lại
+                if (self._seqs[index] == seq and not self._decoded[index]
+                        and self._slots.shape[1:] == frame.shape):
+                    np.copyto(self._slots[index], frame)
+                    self._decoded[index] = True
+        return seq, timestamp, frame
+
+    def jpeg(self, seq):
+        """JPEG gốc của frame seq, None nếu nguồn không có JPEG hoặc slot đã bị ghi đè"""
+        with self._condition:
+            index = seq % self.capacity
+            return self._jpegs[index] if self._seqs[index] == seq else None
+
+    def frame(self, seq):
+        """Frame seq (decode nếu cần), None nếu slot đã bị ghi đè"""
+        with self._condition:
+            item = self._read(seq, True)
+        item = self._finish(item)
+        return item[2] if item is not None else None
+
+    def latest(self, decode=True):
+        """
+        Returns: (seq, timestamp, frame) mới nhất hoặc None
+        decode=False: frame là None, lấy JPEG qua jpeg(seq) hoặc frame qua frame(seq) khi cần
+        """
+        with self._condition:
+            item = self._read(self.seq, decode) if self.seq else None
+        return self._finish(item)
+
+    def wait_for(self, after_seq=0, timeout=None, decode=True):
+        """
+        Chờ tới khi có frame seq > after_seq
+        Returns: (seq, timestamp, frame) mới nhất hoặc None nếu hết timeout (decode như latest())
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.seq > after_seq, timeout):
+                return None
+            item = self._read(self.seq, decode)
+        return self._finish(item)
+
+    def last(self, count, min_spacing=0.0):
+        """
+        Tối đa count frame gần nhất (cũ trước, mới sau), frame cách nhau ít nhất min_spacing giây
+        """
+        with self._condition:
+            items = []
+            last_timestamp = None
+            seq = self.seq
+            while seq > 0 and seq > self.seq - self.capacity and len(items) < count:
+                item = self._read(seq, True)
+                seq -= 1
+                if item is None:
+                    break
+                if last_timestamp is not None and last_timestamp - item[1] < min_spacing:
+                    continue
+                items.append(item)
+                last_timestamp = item[1]
+        frames = [self._finish(item) for item in reversed(items)]
+        return [item for item in frames if item is not None]
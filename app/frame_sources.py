@@ -0,0 +1,286 @@
+import asyncio
+import threading
+import time
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+from .mjpeg import MjpegDemuxer
+
+
+_io_loop = None
+_io_loop_lock = threading.Lock()
+
+
+def get_io_loop():
+    """Event loop dùng chung cho mọi camera session, chạy trên một thread nền"""
+    global _io_loop
+    with _io_loop_lock:
+        if _io_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='camera-io', daemon=True).start()
+            _io_loop = loop
+        return _io_loop
+
+
+class FrameSource:
+    """
+    Nguồn frame của một camera, chạy trên event loop của camera session
+    open() -> bool, read() -> frame BGR hoặc None khi không đọc được, close()
+    encoded = True: read() trả bytes JPEG thay vì frame, reader tự decode khi cần
+    """
+
+    name = 'base'
+    encoded = False
+
+    async def open(self):
+        raise NotImplementedError
+
+    async def read(self):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name})"
+
+
+class BlockingFrameSource(FrameSource):
+    """Nguồn dùng API blocking (OpenCV), mỗi lần gọi chạy trên thread pool của loop"""
+
+    async def open(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self.open_blocking)
+
+    async def read(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self.read_blocking)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.close_blocking)
+
+    def open_blocking(self):
+        raise NotImplementedError
+
+    def read_blocking(self):
+        raise NotImplementedError
+
+    def close_blocking(self):
+        pass
+
+
+class RtspSource(BlockingFrameSource):
+    """RTSP qua cv2.VideoCapture, thử lần lượt các backend"""
+
+    name = 'rtsp'
+    BACKENDS = [
+        (cv2.CAP_FFMPEG, "CAP_FFMPEG"),
+        (cv2.CAP_GSTREAMER, "CAP_GSTREAMER"),
+        (cv2.CAP_ANY, "CAP_ANY"),
+    ]
+
+    def __init__(self, url, timeout_ms=3000):
+        self.url = url
+        self.timeout_ms = timeout_ms
+        self.cap = None
+
+    def open_blocking(self):
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, self.timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, self.timeout_ms]
+        for backend_id, backend_name in self.BACKENDS:
+            cap = None
+            try:
+                print(f"Thử kết nối {self.url} với backend: {backend_name}")
+                cap = cv2.VideoCapture(self.url, backend_id, params)
+                if cap.isOpened():
+                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                    print(f"Kết nối thành công với {backend_name}")
+                    self.cap = cap
+                    return True
+                print(f"Không thể mở stream với {backend_name}")
+            except Exception as e:
+                print(f"Lỗi khi thử {backend_name}: {e}")
+            if cap is not None:
+                cap.release()
+        return False
+
+    def read_blocking(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def close_blocking(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class FileSource(BlockingFrameSource):
+    """Video file, phát theo FPS của file (hoặc fps chỉ định), lặp lại khi hết"""
+
+    name = 'file'
+
+    def __init__(self, path, fps=None, loop=True):
+        self.path = path
+        self.fps = fps
+        self.loop = loop
+        self.cap = None
+        self._next_frame_at = 0
+
+    def open_blocking(self):
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            print(f"Không mở được video file: {self.path}")
+            return False
+        self.fps = self.fps or self.cap.get(cv2.CAP_PROP_FPS) or 15
+        self._next_frame_at = time.monotonic()
+        return True
+
+    def read_blocking(self):
+        delay = self._next_frame_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next_frame_at = max(self._next_frame_at, time.monotonic() - 1) + 1 / self.fps
+
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def close_blocking(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class SyntheticSource(FrameSource):
+    """Frame giả (khối màu chạy qua nền nhiễu) để chạy pipeline/benchmark không cần camera"""
+
+    name = 'synthetic'
+
+    def __init__(self, width=640, height=480, fps=15):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._index = 0
+        self._background = None
+        self._next_frame_at = 0
+
+    async def open(self):
+        rng = np.random.default_rng(0)
+        self._background = rng.integers(40, 80, (self.height, self.width, 3), dtype=np.uint8)
+        self._next_frame_at = time.monotonic()
+        return True
+
+    async def read(self):
+        delay = self._next_frame_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._next_frame_at = max(self._next_frame_at, time.monotonic() - 1) + 1 / self.fps
+
+        frame = self._background.copy()
+        size = self.height // 4
+        x = int((self._index * 4) % (self.width + size)) - size
+        y = self.height // 2 - size // 2 + int(size / 2 * np.sin(self._index / 10))
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (60, 140, 220), -1)
+        cv2.putText(frame, f"#{self._index}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        self._index += 1
+        return frame
+
+
+class HttpMjpegSource(FrameSource):
+    """
+    HTTP MJPEG (vd http://ESP32_IP/stream) đọc bằng asyncio stream, không cần thread riêng cho mỗi stream
+    Trả JPEG mới nhất trong mỗi lần đọc, không decode: ring buffer chỉ decode full frame khi có reader cần
+    """
+
+    name = 'http'
+    encoded = True
+
+    def __init__(self, url, timeout=10, chunk_size=64 * 1024, min_frame_size=1000):
+        self.url = url
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        # Part quá nhỏ không phải ảnh hợp lệ (ESP32 gửi khi đổi độ phân giải)
+        self.min_frame_size = min_frame_size
+        self._reader = None
+        self._writer = None
+        self._demuxer = None
+
+    async def open(self):
+        parts = urlsplit(self.url)
+        if parts.scheme != 'http':
+            raise ValueError(f"HttpMjpegSource chỉ hỗ trợ http://, nhận: {self.url}")
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, parts.port or 80), self.timeout
+        )
+        self._writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: multipart/x-mixed-replace\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1')
+        )
+        await self._writer.drain()
+
+        headers = await asyncio.wait_for(self._reader.readuntil(b'\r\n\r\n'), self.timeout)
+        status_line, _, header_block = headers.decode('latin-1').partition('\r\n')
+        if ' 200' not in status_line:
+            raise ConnectionError(f"HTTP MJPEG trả về: {status_line}")
+        if 'transfer-encoding: chunked' in header_block.lower():
+            raise ConnectionError("HTTP MJPEG dạng chunked chưa được hỗ trợ")
+
+        self._demuxer = MjpegDemuxer()
+        return True
+
+    async def read(self):
+        while True:
+            chunk = await asyncio.wait_for(self._reader.read(self.chunk_size), self.timeout)
+            if not chunk:
+                return None
+
+            frames = [frame for frame in self._demuxer.feed(chunk) if len(frame) >= self.min_frame_size]
+            if frames:
+                # Live stream: frame cũ hơn trong cùng chunk bỏ qua
+                return bytes(frames[-1])
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+
+FRAME_SOURCES = {
+    'rtsp': RtspSource,
+    'http': HttpMjpegSource,
+    'file': FileSource,
+    'synthetic': SyntheticSource,
+}
+
+
+def create_frame_source(source_config, esp32_ip=None):
+    """
+    Dựng FrameSource từ một entry của CAMERA_SOURCES
+    {'TYPE': 'http' | 'rtsp' | 'file' | 'synthetic', 'URL': ..., 'PATH': ..., 'FPS': ..., 'WIDTH': ..., 'HEIGHT': ...}
+    URL trống thì dùng địa chỉ mặc định của ESP32
+    """
+    source_type = source_config.get('TYPE', 'http')
+    if source_type not in FRAME_SOURCES:
+        raise ValueError(f"Frame source không hợp lệ: {source_type} (chọn {', '.join(FRAME_SOURCES)})")
+
+    if source_type == 'rtsp':
+        return RtspSource(source_config.get('URL') or f"rtsp://{esp32_ip}:8554/")
+    if source_type == 'http':
+        return HttpMjpegSource(source_config.get('URL') or f"http://{esp32_ip}/stream")
+    if source_type == 'file':
+        return FileSource(source_config['PATH'], fps=source_config.get('FPS'))
+    return SyntheticSource(
+        width=source_config.get('WIDTH', 640),
+        height=source_config.get('HEIGHT', 480),
+        fps=source_config.get('FPS') or 15
+    )
@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class BatchRunner:
+    """
+    Sở hữu một model duy nhất, gom request từ mọi thread thành batch
+    và chạy một lần forward cho cả batch
+    """
+
+    def __init__(self, name, model, max_batch_size=8, max_wait_ms=5):
+        self.name = name
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"inference-{name}",
+            daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, image):
+        """Đưa một ảnh vào hàng đợi, trả về Future chứa kết quả của ảnh đó"""
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """Gọi đồng bộ: chờ kết quả của một ảnh"""
+        return self.submit(image).result(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            avg = self._requests / self._batches if self._batches else 0
+            return {
+                'batches': self._batches,
+                'requests': self._requests,
+                'avg_batch_size': avg,
+                'pending': self._queue.qsize()
+            }
+
+    def _collect_batch(self):
+        """Chờ request đầu tiên, sau đó gom thêm trong tối đa max_wait giây"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            batch = [(image, future) for image, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            images = [image for image, _ in batch]
+            submit_batch = getattr(self.model, 'submit_batch', None)
+
+            if submit_batch is not None:
+                # Model chạy ở process khác: gửi batch đi rồi gom batch tiếp,
+                # kết quả được trả về qua callback nên nhiều batch chạy song song được
+                try:
+                    batch_future = submit_batch(images)
+                except Exception as e:
+                    self._finish(batch, error=e)
+                    continue
+                batch_future.add_done_callback(
+                    lambda f, batch=batch: self._finish(
+                        batch,
+                        results=None if f.exception() else f.result(),
+                        error=f.exception()
+                    )
+                )
+                continue
+
+            try:
+                results = self.model(images)
+            except Exception as e:
+                self._finish(batch, error=e)
+                continue
+
+            self._finish(batch, results=results)
+
+    def _finish(self, batch, results=None, error=None):
+        if error is not None:
+            print(f"Lỗi inference batch ({self.name}): {error}")
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+
+
+class InferenceService:
+    """
+    Service duy nhất giữ các YOLO model, mỗi model có một BatchRunner riêng
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=5, model_settings=None, worker_settings=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.model_settings = model_settings or {}
+        # WORKER_PROCESSES > 0: model chạy trong pool process riêng thay vì process Daphne
+        self.worker_settings = worker_settings or {}
+        self._worker_pool = None
+        self._runners = {}
+        self._lock = threading.Lock()
+
+    def _model_config(self, name, model_path):
+        options = self.model_settings.get(name.upper(), {})
+        return {
+            'model_path': str(model_path),
+            'backend': options.get('BACKEND', 'ultralytics'),
+            'imgsz': self.model_settings.get('IMGSZ', 640),
+            'threads': self.model_settings.get('THREADS', 0),
+            'quantize': options.get('QUANTIZE', 'none'),
+            'calibration_dir': self.model_settings.get('CALIBRATION_DIR')
+        }
+
+    def _load_model(self, name, model_path):
+        config = self._model_config(name, model_path)
+
+        if self.worker_settings.get('WORKER_PROCESSES', 0) <= 0:
+            from .model_backends import load_backend
+            return load_backend(**config)
+
+        import os
+        if not os.path.exists(model_path):
+            raise Exception(f"Không tìm thấy model tại: {model_path}")
+
+        if self._worker_pool is None:
+            from .inference_workers import InferenceWorkerPool
+            self._worker_pool = InferenceWorkerPool(
+                num_workers=self.worker_settings['WORKER_PROCESSES'],
+                num_slots=self.worker_settings.get('WORKER_SLOTS', 16),
+                slot_bytes=self.worker_settings.get('WORKER_SLOT_BYTES', 1280 * 720 * 3)
+            )
+        return self._worker_pool.model(name, config)
+
+    def get_runner(self, name, model_path):
+        """
+        Load model lần đầu được yêu cầu, các lần sau dùng lại runner cũ
+        Backend (ultralytics/onnx/openvino) lấy theo MODEL_SETTINGS[name.upper()]
+        """
+        with self._lock:
+            runner = self._runners.get(name)
+            if runner is None:
+                model = self._load_model(name, model_path)
+                runner = BatchRunner(
+                    name, model,
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms
+                )
+                self._runners[name] = runner
+            return runner
+
+    def stats(self):
+        with self._lock:
+            runners = dict(self._runners)
+        return {name: runner.stats() for name, runner in runners.items()}
+
+
+_inference_service = None
+_inference_service_lock = threading.Lock()
+
+
+def get_inference_service():
+    """Singleton pattern cho inference service"""
+    global _inference_service
+    if _inference_service is None:
+        with _inference_service_lock:
+            if _inference_service is None:
+                from django.conf import settings
+                inference_settings = getattr(settings, 'INFERENCE_SETTINGS', {})
+                _inference_service = InferenceService(
+                    max_batch_size=inference_settings.get('MAX_BATCH_SIZE', 8),
+                    max_wait_ms=inference_settings.get('MAX_WAIT_MS', 5),
+                    model_settings=getattr(settings, 'MODEL_SETTINGS', {}),
+                    worker_settings=inference_settings
+                )
+    return _inference_service
@@ -0,0 +1,222 @@
+import atexit
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _worker_main(shm_name, slot_bytes, tasks, results, loader):
+    """
+    Vòng lặp của một process inference: load model một lần, đọc frame trực tiếp
+    từ slot shared memory và trả kết quả dạng mảng nhỏ
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    models = {}
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        request_id, model_name, model_config, frames = task
+        try:
+            model = models.get(model_name)
+            if model is None:
+                model = loader(**model_config)
+                models[model_name] = model
+
+            images = [
+                inline if slot < 0 else
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                for slot, shape, inline in frames
+            ]
+            raw_results = model(images)
+            payload = [(r.boxes, r.scores, r.class_ids) for r in raw_results]
+            del images
+            results.put((request_id, payload, getattr(model, 'names', {}), None))
+        except Exception as e:
+            results.put((request_id, None, None, f"{type(e).__name__}: {e}"))
+
+    models.clear()
+    shm.close()
+
+
+class _Worker:
+    __slots__ = ('process', 'tasks', 'pending')
+
+    def __init__(self, process, tasks):
+        self.process = process
+        self.tasks = tasks
+        self.pending = set()
+
+
+class InferenceWorkerPool:
+    """
+    Pool các process inference, mỗi process load model một lần
+    Frame được copy vào các slot của một block shared memory thay vì pickle cả mảng,
+    chỉ index slot và shape đi qua queue
+    """
+
+    def __init__(self, num_workers=2, num_slots=16, slot_bytes=1280 * 720 * 3, loader=None,
+                 slot_timeout=2.0, check_interval=1.0):
+        if loader is None:
+            from .model_backends import load_backend
+            loader = load_backend
+
+        self.slot_bytes = int(slot_bytes)
+        self.loader = loader
+        self.slot_timeout = slot_timeout
+        self.check_interval = check_interval
+
+        self._ctx = multiprocessing.get_context('spawn')
+        self._shm = shared_memory.SharedMemory(create=True, size=int(num_slots) * self.slot_bytes)
+        self._free_slots = queue.Queue()
+        for slot in range(int(num_slots)):
+            self._free_slots.put(slot)
+
+        self._results = self._ctx.Queue()
+        self._ids = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self._workers = [self._start_worker() for _ in range(max(1, int(num_workers)))]
+        self._collector = threading.Thread(target=self._collect_results, name='inference-pool', daemon=True)
+        self._collector.start()
+        atexit.register(self.close)
+
+    def _start_worker(self):
+        tasks = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self._shm.name, self.slot_bytes, tasks, self._results, self.loader),
+            daemon=True
+        )
+        process.start()
+        return _Worker(process, tasks)
+
+    def _write_frame(self, image):
+        """
+        Copy frame vào một slot trống (chờ tối đa slot_timeout nếu hết slot)
+        Frame quá lớn hoặc chờ slot quá lâu thì gửi kèm task
+        """
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if image.nbytes > self.slot_bytes:
+            return (-1, image.shape, image)
+
+        try:
+            slot = self._free_slots.get(timeout=self.slot_timeout)
+        except queue.Empty:
+            return (-1, image.shape, image)
+        view = np.ndarray(image.shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+        view[...] = image
+        return (slot, image.shape, None)
+
+    def _release(self, frames):
+        for slot, _, _ in frames:
+            if slot >= 0:
+                self._free_slots.put(slot)
+
+    def submit_batch(self, model_name, model_config, images):
+        """
+        Gửi một batch cho process đang rảnh nhất, trả về Future chứa list RawResult
+        model_config: tham số của load_backend, process load model ở lần đầu gặp model_name
+        """
+        if self._closed:
+            raise RuntimeError("Inference pool đã đóng")
+
+        frames = [self._write_frame(image) for image in images]
+        future = Future()
+        request_id = next(self._ids)
+
+        with self._lock:
+            worker = min(self._workers, key=lambda w: len(w.pending))
+            worker.pending.add(request_id)
+            self._pending[request_id] = (future, frames, worker)
+            worker.tasks.put((request_id, model_name, model_config, frames))
+
+        return future
+
+    def _collect_results(self):
+        from .model_backends import RawResult
+
+        next_check = time.monotonic() + self.check_interval
+        while not self._closed:
+            # Kiểm tra worker theo chu kỳ, kể cả khi các worker khác vẫn liên tục trả kết quả
+            now = time.monotonic()
+            if now >= next_check:
+                self._check_workers()
+                next_check = now + self.check_interval
+
+            try:
+                request_id, payload, names, error = self._results.get(timeout=max(0.0, next_check - now))
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+                if entry is not None:
+                    entry[2].pending.discard(request_id)
+            if entry is None:
+                continue
+
+            future, frames, _ = entry
+            self._release(frames)
+            if error is not None:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result([
+                    RawResult(boxes, scores, class_ids, names) for boxes, scores, class_ids in payload
+                ])
+
+    def _check_workers(self):
+        """Process chết thì huỷ các request đang chờ nó và khởi động process mới"""
+        with self._lock:
+            for index, worker in enumerate(self._workers):
+                if worker.process.is_alive():
+                    continue
+
+                print(f"Inference worker {worker.process.pid} đã dừng (exit {worker.process.exitcode}), khởi động lại")
+                for request_id in worker.pending:
+                    future, frames, _ = self._pending.pop(request_id)
+                    self._release(frames)
+                    future.set_exception(RuntimeError("Inference worker bị dừng"))
+                self._workers[index] = self._start_worker()
+
+    def model(self, model_name, model_config):
+        return PooledModel(self, model_name, model_config)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            worker.tasks.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=2)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._shm.close()
+        self._shm.unlink()
+
+
+class PooledModel:
+    """Proxy của một model chạy trong InferenceWorkerPool, dùng được như backend trong BatchRunner"""
+
+    def __init__(self, pool, model_name, model_config):
+        self.pool = pool
+        self.model_name = model_name
+        self.model_config = model_config
+
+    def submit_batch(self, images):
+        return self.pool.submit_batch(self.model_name, self.model_config, images)
+
+    def __call__(self, images):
+        return self.submit_batch(images).result()
@@ -0,0 +1,169 @@
+import ctypes
+import ctypes.util
+import threading
+
+import cv2
+import numpy as np
+
+from .utils import get_flip_code
+
+
+# libjpeg-turbo (TurboJPEG API) cho flip/xoay 180 lossless trên hệ số DCT, không decode/encode lại
+TJXOP_HFLIP = 1
+TJXOP_VFLIP = 2
+TJXOP_ROT180 = 6
+# Báo lỗi thay vì để nguyên các block lẻ ở mép khi kích thước không chia hết cho iMCU
+TJXOPT_PERFECT = 1
+
+# flip code của cv2.flip -> phép biến đổi tương đương của TurboJPEG
+FLIP_CODE_TO_TJXOP = {
+    1: TJXOP_HFLIP,
+    0: TJXOP_VFLIP,
+    -1: TJXOP_ROT180,
+}
+
+
+class _TJRegion(ctypes.Structure):
+    _fields_ = [('x', ctypes.c_int), ('y', ctypes.c_int), ('w', ctypes.c_int), ('h', ctypes.c_int)]
+
+
+class _TJTransform(ctypes.Structure):
+    _fields_ = [
+        ('r', _TJRegion),
+        ('op', ctypes.c_int),
+        ('options', ctypes.c_int),
+        ('data', ctypes.c_void_p),
+        ('customFilter', ctypes.c_void_p),
+    ]
+
+
+def _load_turbojpeg():
+    names = [ctypes.util.find_library('turbojpeg'), 'libturbojpeg.so.0', 'libturbojpeg.dylib', 'turbojpeg.dll']
+    for name in names:
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+        except OSError:
+            continue
+
+        lib.tjInitTransform.restype = ctypes.c_void_p
+        lib.tjInitTransform.argtypes = []
+        lib.tjTransform.restype = ctypes.c_int
+        lib.tjTransform.argtypes = [
+            ctypes.c_void_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_int,
+            ctypes.POINTER(ctypes.POINTER(ctypes.c_ubyte)), ctypes.POINTER(ctypes.c_ulong),
+            ctypes.POINTER(_TJTransform), ctypes.c_int
+        ]
+        lib.tjFree.restype = None
+        lib.tjFree.argtypes = [ctypes.POINTER(ctypes.c_ubyte)]
+        lib.tjGetErrorStr.restype = ctypes.c_char_p
+        lib.tjGetErrorStr.argtypes = []
+        return lib
+    return None
+
+
+_turbojpeg = _load_turbojpeg()
+TURBOJPEG_AVAILABLE = _turbojpeg is not None
+
+
+class JpegTransform:
+    """
+    Biến đổi hướng camera trên JPEG, CAMERA_SETTINGS được gộp một lần thành phép rẻ nhất:
+    - không cần biến đổi: trả nguyên bytes JPEG gốc
+    - flip/xoay 180: biến đổi lossless bằng TurboJPEG nếu có
+    - còn lại (không có libturbojpeg hoặc ảnh không biến đổi lossless được): decode + flip + encode
+    Chỉ áp dụng cho nguồn có sẵn JPEG (HTTP MJPEG của ESP32); RTSP là H.264, trình duyệt không nhận
+    thẳng được nên frame RTSP luôn decode rồi encode JPEG (apply_frame + imencode), không có passthrough
+    """
+
+    def __init__(self, flip_code=None, fallback_quality=80):
+        self.flip_code = flip_code
+        self.fallback_quality = fallback_quality
+        self.op = FLIP_CODE_TO_TJXOP.get(flip_code)
+        self._local = threading.local()
+
+    @classmethod
+    def from_settings(cls, camera_settings, fallback_quality=80):
+        return cls(get_flip_code(camera_settings), fallback_quality)
+
+    @property
+    def passthrough(self):
+        return self.flip_code is None
+
+    def apply(self, jpeg):
+        """Returns: bytes JPEG đã đúng hướng"""
+        if self.passthrough:
+            return jpeg
+
+        if TURBOJPEG_AVAILABLE:
+            transformed = self._lossless(jpeg)
+            if transformed is not None:
+                return transformed
+
+        return self._transcode(jpeg)
+
+    def apply_frame(self, frame):
+        """Biến đổi tương tự cho frame đã decode (RTSP), một lần cv2.flip"""
+        if self.passthrough:
+            return frame
+        return cv2.flip(frame, self.flip_code)
+
+    def _handle(self):
+        # tjhandle không dùng chung giữa các thread
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            handle = _turbojpeg.tjInitTransform()
+            self._local.handle = handle
+        return handle
+
+    def _lossless(self, jpeg):
+        handle = self._handle()
+        if not handle:
+            return None
+
+        jpeg = bytes(jpeg)
+        transform = _TJTransform()
+        transform.op = self.op
+        transform.options = TJXOPT_PERFECT
+        dst_buf = ctypes.POINTER(ctypes.c_ubyte)()
+        dst_size = ctypes.c_ulong(0)
+
+        result = _turbojpeg.tjTransform(
+            handle, jpeg, len(jpeg), 1, ctypes.byref(dst_buf), ctypes.byref(dst_size),
+            ctypes.byref(transform), 0
+        )
+        try:
+            if result != 0:
+                return None
+            return ctypes.string_at(dst_buf, dst_size.value)
+        finally:
+            if dst_buf:
+                _turbojpeg.tjFree(dst_buf)
+
+    def _transcode(self, jpeg):
+        image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return jpeg
+        ret, buffer = cv2.imencode(
+            '.jpg', cv2.flip(image, self.flip_code), [cv2.IMWRITE_JPEG_QUALITY, self.fallback_quality]
+        )
+        return buffer.tobytes() if ret else jpeg
+
+
+_jpeg_transform = None
+_jpeg_transform_lock = threading.Lock()
+
+
+def get_jpeg_transform():
+    """Singleton JpegTransform dựng từ CAMERA_SETTINGS"""
+    global _jpeg_transform
+    if _jpeg_transform is None:
+        with _jpeg_transform_lock:
+            if _jpeg_transform is None:
+                from django.conf import settings
+                _jpeg_transform = JpegTransform.from_settings(getattr(settings, 'CAMERA_SETTINGS', {}))
+                mode = ('passthrough' if _jpeg_transform.passthrough
+                        else 'lossless' if TURBOJPEG_AVAILABLE else 'transcode')
+                print(f"JPEG transform: {mode} (flip code {_jpeg_transform.flip_code})")
+    return _jpeg_transform
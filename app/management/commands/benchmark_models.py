@@ -0,0 +1,154 @@
+import os
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.model_backends import OnnxBackend, RawResult, UltralyticsBackend, export_model, list_images, quantize_model
+from app.tracker import iou_matrix
+
+
+MODEL_FILES = {
+    'cat': 'cat.pt',
+    'disease': 'cat-detect.pt',
+}
+
+
+def match_boxes(reference, candidate, iou_threshold):
+    """
+    Ghép greedy box của bản cần so với bản tham chiếu theo IoU giảm dần
+    Returns: list (index_ref, index_cand, iou)
+    """
+    iou = iou_matrix(reference.boxes, candidate.boxes)
+    matches = []
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        matches.append((i, j, float(iou[i, j])))
+        iou[i, :] = -1
+        iou[:, j] = -1
+    return matches
+
+
+class Command(BaseCommand):
+    help = ('So sánh model gốc (ultralytics), ONNX FP32 và INT8 trên một thư mục ảnh: '
+            'latency, throughput và độ khớp box/class')
+
+    def add_arguments(self, parser):
+        parser.add_argument('image_dir', help='Thư mục ảnh dùng để benchmark')
+        parser.add_argument('--model', choices=['cat', 'disease', 'all'], default='all')
+        parser.add_argument('--mode', choices=['dynamic', 'static'], default='dynamic',
+                            help='Kiểu quantize INT8')
+        parser.add_argument('--calibration-dir', default=None,
+                            help='Thư mục frame calibration cho static (mặc định MODEL_CALIBRATION_DIR)')
+        parser.add_argument('--conf', type=float, default=0.5, help='Ngưỡng confidence khi so sánh')
+        parser.add_argument('--match-iou', type=float, default=0.5, help='IoU tối thiểu để coi là cùng box')
+        parser.add_argument('--limit', type=int, default=0, help='Số ảnh tối đa (0 = tất cả)')
+        parser.add_argument('--warmup', type=int, default=3, help='Số lần chạy khởi động không tính giờ')
+
+    def handle(self, *args, **options):
+        image_dir = options['image_dir']
+        if not os.path.isdir(image_dir):
+            raise CommandError(f"Không tìm thấy thư mục: {image_dir}")
+
+        images = [cv2.imread(path) for path in list_images(image_dir, options['limit'] or None)]
+        images = [image for image in images if image is not None]
+        if not images:
+            raise CommandError(f"Không có ảnh nào đọc được trong: {image_dir}")
+
+        model_settings = getattr(settings, 'MODEL_SETTINGS', {})
+        imgsz = model_settings.get('IMGSZ', 640)
+        threads = model_settings.get('THREADS', 0)
+        calibration_dir = options['calibration_dir'] or model_settings.get('CALIBRATION_DIR')
+
+        models = list(MODEL_FILES) if options['model'] == 'all' else [options['model']]
+        for name in models:
+            model_path = os.path.join(settings.BASE_DIR, 'static', 'model', MODEL_FILES[name])
+            try:
+                onnx_path = export_model(model_path, 'onnx', imgsz)
+                quantized_path = quantize_model(onnx_path, options['mode'], calibration_dir, imgsz)
+                fp32 = OnnxBackend(onnx_path, threads=threads, imgsz=imgsz)
+                int8 = OnnxBackend(quantized_path, threads=threads, imgsz=imgsz)
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"[{name}] Không thể chuẩn bị model: {e}"))
+                continue
+
+            # Baseline là model .pt chạy qua ultralytics như lúc serve mặc định
+            backends = []
+            try:
+                backends.append(('Ultralytics', UltralyticsBackend(model_path)))
+            except Exception as e:
+                self.stderr.write(self.style.WARNING(f"[{name}] Bỏ qua baseline ultralytics: {e}"))
+            backends += [('FP32', fp32), ('INT8', int8)]
+
+            self.stdout.write(f"\n[{name}] {len(images)} ảnh, INT8 {options['mode']}")
+            runs = [(label, *self._run(backend, images, options['warmup'])) for label, backend in backends]
+
+            baseline_label, baseline_results, baseline_times = runs[0]
+            for label, _, times in runs:
+                self._report_latency(label, times)
+            for label, _, times in runs[1:]:
+                speedup = np.mean(baseline_times) / np.mean(times)
+                self.stdout.write(f"  Speedup {label}: {speedup:.2f}x so với {baseline_label}")
+
+            for label, results, _ in runs[1:]:
+                self._report_agreement(
+                    baseline_label, baseline_results, label, results, options['conf'], options['match_iou']
+                )
+            if baseline_label != 'FP32':
+                self._report_agreement('FP32', runs[-2][1], 'INT8', runs[-1][1], options['conf'], options['match_iou'])
+
+    def _run(self, backend, images, warmup):
+        for image in images[:warmup]:
+            backend([image])
+
+        results, times = [], []
+        for image in images:
+            start = time.perf_counter()
+            results.append(backend([image])[0])
+            times.append(time.perf_counter() - start)
+        return results, np.array(times)
+
+    def _report_latency(self, label, times):
+        ms = times * 1000
+        self.stdout.write(
+            f"  {label}: mean {ms.mean():.1f} ms, p50 {np.percentile(ms, 50):.1f} ms, "
+            f"p95 {np.percentile(ms, 95):.1f} ms, throughput {len(times) / times.sum():.1f} ảnh/s"
+        )
+
+    def _report_agreement(self, reference_label, reference_results, label, results, conf, match_iou):
+        reference_total = total = matched = same_class = 0
+        ious, score_diffs = [], []
+
+        for reference, candidate in zip(reference_results, results):
+            reference = _filter(reference, conf)
+            candidate = _filter(candidate, conf)
+            reference_total += len(reference)
+            total += len(candidate)
+
+            for i, j, iou in match_boxes(reference, candidate, match_iou):
+                matched += 1
+                ious.append(iou)
+                score_diffs.append(abs(float(reference.scores[i]) - float(candidate.scores[j])))
+                if reference.class_ids[i] == candidate.class_ids[j]:
+                    same_class += 1
+
+        recall = matched / reference_total if reference_total else 1.0
+        precision = matched / total if total else 1.0
+        class_agreement = same_class / matched if matched else 1.0
+
+        self.stdout.write(f"  {label} so với {reference_label}:")
+        self.stdout.write(f"  Box {reference_label}/{label}: {reference_total}/{total}, khớp {matched}")
+        self.stdout.write(f"  Box recall: {recall * 100:.1f}%, precision: {precision * 100:.1f}%")
+        self.stdout.write(f"  Class agreement: {class_agreement * 100:.1f}%")
+        if matched:
+            self.stdout.write(
+                f"  IoU trung bình: {np.mean(ious):.3f}, lệch confidence trung bình: {np.mean(score_diffs):.3f}"
+            )
+
+
+def _filter(result, conf):
+    """Bản copy chỉ giữ box có score >= conf, không sửa result (còn dùng cho các lần so sánh khác)"""
+    keep = result.scores >= conf
+    return RawResult(result.boxes[keep], result.scores[keep], result.class_ids[keep], result.names)
@@ -0,0 +1,113 @@
+import re
+
+
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+CONTENT_LENGTH_RE = re.compile(rb'content-length:\s*(\d+)', re.IGNORECASE)
+
+
+class MjpegDemuxer:
+    """
+    Tách frame JPEG từ stream multipart/x-mixed-replace (MJPEG) theo từng chunk
+    - Dùng Content-Length của mỗi part nếu có (không bị nhầm bởi \\xff\\xd9 trong thumbnail),
+      không có thì tìm marker SOI/EOI
+    - Buffer là bytearray, mỗi lần tìm tiếp từ chỗ đã dừng nên tổng chi phí tuyến tính theo số byte
+    - Frame trả về là memoryview vào buffer (không copy), chỉ hợp lệ tới lần feed() kế tiếp;
+      cần giữ lâu hơn thì bytes(frame)
+    """
+
+    def __init__(self, max_buffer_size=4 * 1024 * 1024):
+        self.max_buffer_size = max_buffer_size
+        self._buffer = bytearray()
+        self._start = 0
+        self._scan = 0
+        self._frame_start = None
+        self._frame_length = None
+        self._views = []
+
+    def feed(self, chunk):
+        """Returns: list memoryview các frame JPEG hoàn chỉnh có trong chunk"""
+        self._release()
+        self._buffer += chunk
+
+        frames = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+
+        if self._frame_start is None and len(self._buffer) - self._start > self.max_buffer_size:
+            # Rác không có frame nào, chỉ giữ byte cuối phòng marker bị cắt đôi
+            self._start = self._scan = len(self._buffer) - 1
+        return frames
+
+    def _release(self):
+        """Giải phóng view của lần trước rồi mới được thu gọn buffer"""
+        exported = False
+        for view in self._views:
+            try:
+                view.release()
+            except BufferError:
+                # Caller vẫn giữ một export (vd np.frombuffer) của frame
+                exported = True
+        self._views = []
+
+        if exported:
+            # Không được resize buffer đang bị giữ, chuyển phần chưa xử lý sang buffer mới
+            self._buffer = self._buffer[self._start:]
+            self._rebase()
+        elif self._start:
+            try:
+                del self._buffer[:self._start]
+            except BufferError:
+                # Còn export khác của buffer (vd memoryview cắt từ frame), không thu gọn tại chỗ được
+                self._buffer = self._buffer[self._start:]
+            self._rebase()
+
+    def _rebase(self):
+        if self._start:
+            self._scan -= self._start
+            if self._frame_start is not None:
+                self._frame_start -= self._start
+            self._start = 0
+
+    def _next_frame(self):
+        buffer = self._buffer
+
+        if self._frame_start is None:
+            soi = buffer.find(SOI, self._scan)
+            if soi == -1:
+                self._scan = max(self._start, len(buffer) - 1)
+                return None
+
+            # Header của part nằm giữa frame trước và SOI
+            match = CONTENT_LENGTH_RE.search(buffer, self._start, soi)
+            self._frame_start = soi
+            self._frame_length = int(match.group(1)) if match else None
+            self._scan = soi + 2
+
+        start = self._frame_start
+        if self._frame_length:
+            end = start + self._frame_length
+            if len(buffer) < end:
+                return None
+            if buffer[end - 2:end] == EOI:
+                return self._emit(start, end)
+            # Content-Length không khớp dữ liệu, chuyển sang tìm marker
+            self._frame_length = None
+
+        eoi = buffer.find(EOI, self._scan)
+        if eoi == -1:
+            self._scan = max(start + 2, len(buffer) - 1)
+            return None
+        return self._emit(start, eoi + 2)
+
+    def _emit(self, start, end):
+        view = memoryview(self._buffer)[start:end]
+        self._views.append(view)
+        self._start = self._scan = end
+        self._frame_start = None
+        self._frame_length = None
+        return view
+
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+
+import cv2
+
+from .camera_session import get_camera_session
+from .jpeg_transform import get_jpeg_transform
+from .utils import create_blank_frame
+
+
+MJPEG_BOUNDARY = 'frame'
+
+
+def mjpeg_part(jpeg):
+    """Một part của multipart/x-mixed-replace"""
+    return b''.join((
+        b'--frame\r\n'
+        b'Content-Type: image/jpeg\r\n\r\n',
+        jpeg,
+        b'\r\n\r\n'
+    ))
+
+
+class RelaySubscriber:
+    """Một client HTTP MJPEG, chỉ giữ vài frame mới nhất; client chậm thì bỏ frame cũ"""
+
+    def __init__(self, relay, loop, buffer_size=2):
+        self.relay = relay
+        self.loop = loop
+        self.skipped = 0
+        self._queue = asyncio.Queue(maxsize=buffer_size)
+
+    def publish(self, part):
+        """Gọi từ thread upstream"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, part)
+        except RuntimeError:
+            # Event loop đã đóng
+            self.relay.unsubscribe(self)
+
+    def _put(self, part):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.skipped += 1
+        self._queue.put_nowait(part)
+
+    async def parts(self):
+        """Async generator các part MJPEG cho StreamingHttpResponse"""
+        try:
+            while True:
+                yield await self._queue.get()
+        finally:
+            self.relay.unsubscribe(self)
+
+
+class MjpegRelay:
+    """
+    Phát frame của camera session cho mọi client /video-feed/, không tự mở kết nối tới camera:
+    upstream duy nhất là nguồn của CameraSession (dùng chung với stream WebSocket, DVR, snapshot)
+    Giữ session khi có client đầu tiên, trả lại khi không còn client sau idle_grace_seconds
+    Mỗi frame chỉ được flip và đóng part một lần; nguồn có sẵn JPEG thì không encode lại
+    """
+
+    def __init__(self, camera_id, jpeg_transform, idle_grace_seconds=10, buffer_size=2,
+                 jpeg_quality=80, timeout=10):
+        self.camera_id = camera_id
+        self.jpeg_transform = jpeg_transform
+        self.idle_grace_seconds = idle_grace_seconds
+        self.buffer_size = buffer_size
+        self.jpeg_quality = jpeg_quality
+        self.timeout = timeout
+
+        self.subscribers = set()
+        self.latest_part = None
+        self.frame_count = 0
+        self._idle_since = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Gọi từ event loop"""
+        subscriber = RelaySubscriber(self, asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self.subscribers.add(subscriber)
+            self._idle_since = None
+            if self.latest_part is not None:
+                # Client mới thấy hình ngay, không phải chờ frame kế tiếp
+                subscriber._put(self.latest_part)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"mjpeg-relay-{self.camera_id}", daemon=True
+                )
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self.subscribers.discard(subscriber)
+            if not self.subscribers and self._idle_since is None:
+                self._idle_since = time.monotonic()
+
+    def _stop_if_idle(self):
+        with self._lock:
+            if self.subscribers or self._idle_since is None:
+                return False
+            if time.monotonic() - self._idle_since < self.idle_grace_seconds:
+                return False
+            if self._thread is threading.current_thread():
+                self._thread = None
+                self.latest_part = None
+            return True
+
+    def _publish(self, part):
+        with self._lock:
+            self.latest_part = part
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.publish(part)
+
+    def _run(self):
+        session = get_camera_session(self.camera_id)
+        session.acquire()
+        print(f"MJPEG relay {self.camera_id}: phát frame từ camera session")
+        last_seq = 0
+        last_frame_at = time.monotonic()
+        try:
+            while not self._stop_if_idle():
+                item = session.frames.wait_for(last_seq, timeout=1, decode=False)
+                if item is None:
+                    if time.monotonic() - last_frame_at >= self.timeout:
+                        # Session đang kết nối lại, client thấy trạng thái thay vì hình đứng
+                        self._publish(mjpeg_part(create_blank_frame(f"Mất kết nối camera ({session.state})")))
+                        last_frame_at = time.monotonic()
+                    continue
+
+                last_seq = item[0]
+                last_frame_at = time.monotonic()
+                jpeg = self._to_jpeg(session.frames, last_seq)
+                if jpeg is None:
+                    continue
+                self._publish(mjpeg_part(jpeg))
+                self.frame_count += 1
+                if self.frame_count % 100 == 0:
+                    print(f"Relayed {self.frame_count} frames to {len(self.subscribers)} clients")
+        except Exception as e:
+            print(f"Stream error: {str(e)}")
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+        finally:
+            session.release()
+        print(f"MJPEG relay {self.camera_id}: dừng sau {self.frame_count} frames")
+
+    def _to_jpeg(self, frames, seq):
+        """JPEG của camera nếu nguồn là HTTP MJPEG, nguồn RTSP (H.264) thì encode lại frame đã decode"""
+        jpeg = frames.jpeg(seq)
+        if jpeg is not None:
+            return self.jpeg_transform.apply(jpeg)
+        frame = frames.frame(seq)
+        if frame is None:
+            return None
+        ret, buffer = cv2.imencode(
+            '.jpg', self.jpeg_transform.apply_frame(frame), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        )
+        return buffer.tobytes() if ret else None
+
+
+_relays = {}
+_relays_lock = threading.Lock()
+
+
+def get_mjpeg_relay(camera_id='default'):
+    """Relay của camera, dựng từ CAMERA_SETTINGS ở lần đầu"""
+    with _relays_lock:
+        relay = _relays.get(camera_id)
+        if relay is None:
+            from django.conf import settings
+            camera_settings = getattr(settings, 'CAMERA_SETTINGS', {})
+            relay = MjpegRelay(
+                camera_id,
+                get_jpeg_transform(),
+                idle_grace_seconds=camera_settings.get('RELAY_IDLE_GRACE_SECONDS', 10),
+                buffer_size=camera_settings.get('RELAY_BUFFER_SIZE', 2)
+            )
+            _relays[camera_id] = relay
+        return relay
@@ -0,0 +1,407 @@
+import ast
+import os
+
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+try:
+    from openvino.runtime import Core
+    OPENVINO_AVAILABLE = True
+except ImportError:
+    OPENVINO_AVAILABLE = False
+
+
+# Giống giá trị mặc định khi predict của ultralytics, ngưỡng của caller lọc tiếp sau đó
+DEFAULT_CONF_THRESHOLD = 0.25
+DEFAULT_IOU_THRESHOLD = 0.7
+DEFAULT_MAX_DET = 300
+
+
+class RawResult:
+    """
+    Kết quả của một ảnh dưới dạng mảng NumPy, giống nhau cho mọi backend
+    boxes: (N, 4) xyxy theo toạ độ ảnh gốc, scores: (N,), class_ids: (N,)
+    """
+    __slots__ = ('boxes', 'scores', 'class_ids', 'names')
+
+    def __init__(self, boxes, scores, class_ids, names=None):
+        self.boxes = boxes
+        self.scores = scores
+        self.class_ids = class_ids
+        self.names = names or {}
+
+    @classmethod
+    def empty(cls, names=None):
+        return cls(np.zeros((0, 4), dtype=np.float32),
+                   np.zeros(0, dtype=np.float32),
+                   np.zeros(0, dtype=np.int32),
+                   names)
+
+    def __len__(self):
+        return len(self.scores)
+
+
+def _to_numpy(values):
+    if hasattr(values, 'cpu'):
+        values = values.cpu().numpy()
+    return np.asarray(values)
+
+
+class UltralyticsBackend:
+    """Backend mặc định: YOLO object của ultralytics load từ file .pt"""
+
+    name = 'ultralytics'
+
+    def __init__(self, model_path, **options):
+        from .disease_detector import ModelLoader
+        self.model = ModelLoader.load_model(model_path)
+        self.names = dict(getattr(self.model, 'names', None) or {})
+
+    def __call__(self, images):
+        results = self.model(images)
+        return [self._to_raw(result) for result in results]
+
+    def _to_raw(self, result):
+        """Lấy xyxy/conf/cls của cả ảnh một lần, không lặp từng box"""
+        boxes = getattr(result, 'boxes', None)
+        names = getattr(result, 'names', None) or self.names
+        if boxes is None or len(boxes) == 0:
+            return RawResult.empty(names)
+
+        return RawResult(
+            _to_numpy(boxes.xyxy).astype(np.float32, copy=False).reshape(-1, 4),
+            _to_numpy(boxes.conf).astype(np.float32, copy=False).reshape(-1),
+            _to_numpy(boxes.cls).astype(np.int32).reshape(-1),
+            names
+        )
+
+
+def letterbox(image, size):
+    """
+    Resize giữ tỉ lệ và pad về (size, size) như LetterBox của ultralytics
+    Returns: (ảnh đã pad, scale, (pad_x, pad_y))
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x = (size - new_w) // 2
+    pad_y = (size - new_h) // 2
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image
+    return canvas, scale, (pad_x, pad_y)
+
+
+def preprocess_batch(images, imgsz):
+    """
+    Letterbox cả batch và chuyển sang tensor NCHW float32 cho ONNX/OpenVINO
+    Returns: (blob, [(canvas, scale, pad), ...])
+    """
+    prepared = [letterbox(image, imgsz) for image in images]
+
+    # BGR -> RGB, HWC -> CHW, [0, 255] -> [0, 1]
+    blob = np.stack([canvas for canvas, _, _ in prepared])[..., ::-1].transpose(0, 3, 1, 2)
+    blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+    return blob, prepared
+
+
+def non_max_suppression(boxes, scores, class_ids, iou_threshold=DEFAULT_IOU_THRESHOLD,
+                        max_det=DEFAULT_MAX_DET):
+    """
+    NMS theo từng class bằng NumPy (dịch box của mỗi class ra xa nhau rồi NMS một lần)
+    Returns: index của các box được giữ, sắp theo score giảm dần
+    """
+    if len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    offsets = class_ids.astype(np.float32)[:, None] * (boxes.max() + 1)
+    shifted = boxes + offsets
+    x1, y1, x2, y2 = shifted.T
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+
+    order = scores.argsort()[::-1]
+    keep = []
+
+    while order.size and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        inter_w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        inter_h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+class _NumpyYoloBackend:
+    """
+    Phần chung của các CPU runtime: tiền xử lý letterbox, decode output
+    (B, 4 + nc, anchors) của YOLOv8/YOLO11 và NMS đều bằng NumPy
+    """
+
+    name = None
+
+    def __init__(self, imgsz=640, conf_threshold=DEFAULT_CONF_THRESHOLD,
+                 iou_threshold=DEFAULT_IOU_THRESHOLD, max_det=DEFAULT_MAX_DET):
+        self.imgsz = int(imgsz)
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+        self.names = {}
+        self.supports_batch = True
+
+    def _infer(self, blob):
+        raise NotImplementedError
+
+    def __call__(self, images):
+        blob, prepared = preprocess_batch(images, self.imgsz)
+
+        if self.supports_batch:
+            outputs = self._infer(blob)
+        else:
+            outputs = np.concatenate([self._infer(blob[i:i + 1]) for i in range(len(blob))])
+
+        return [
+            self._postprocess(output, image.shape[:2], scale, pad)
+            for output, image, (_, scale, pad) in zip(outputs, images, prepared)
+        ]
+
+    def _postprocess(self, output, image_shape, scale, pad):
+        predictions = output.T
+        class_scores = predictions[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+
+        keep = scores >= self.conf_threshold
+        if not keep.any():
+            return RawResult.empty(self.names)
+
+        predictions, scores, class_ids = predictions[keep], scores[keep], class_ids[keep]
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+        keep = non_max_suppression(boxes, scores, class_ids, self.iou_threshold, self.max_det)
+        boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+
+        # Bỏ padding và scale về kích thước ảnh gốc
+        pad_x, pad_y = pad
+        boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=boxes.dtype)
+        boxes /= scale
+        height, width = image_shape
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+
+        return RawResult(boxes.astype(np.float32), scores.astype(np.float32),
+                         class_ids.astype(np.int32), self.names)
+
+
+class OnnxBackend(_NumpyYoloBackend):
+    """Chạy model ONNX bằng ONNX Runtime trên CPU"""
+
+    name = 'onnx'
+
+    def __init__(self, onnx_path, threads=0, **options):
+        if not ONNXRUNTIME_AVAILABLE:
+            raise Exception("ONNX Runtime không khả dụng. Cần cài đặt onnxruntime")
+        super().__init__(**options)
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            session_options.intra_op_num_threads = int(threads)
+
+        self.session = ort.InferenceSession(
+            str(onnx_path), sess_options=session_options, providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.supports_batch = not isinstance(model_input.shape[0], int)
+        if isinstance(model_input.shape[2], int):
+            self.imgsz = model_input.shape[2]
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if 'names' in metadata:
+            self.names = ast.literal_eval(metadata['names'])
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(_NumpyYoloBackend):
+    """Chạy model OpenVINO IR trên CPU"""
+
+    name = 'openvino'
+
+    def __init__(self, model_dir, threads=0, **options):
+        if not OPENVINO_AVAILABLE:
+            raise Exception("OpenVINO không khả dụng. Cần cài đặt openvino")
+        super().__init__(**options)
+
+        xml_files = [f for f in os.listdir(model_dir) if f.endswith('.xml')]
+        if not xml_files:
+            raise Exception(f"Không tìm thấy file .xml trong: {model_dir}")
+
+        core = Core()
+        config = {'INFERENCE_NUM_THREADS': int(threads)} if threads else {}
+        model = core.read_model(os.path.join(model_dir, xml_files[0]))
+        self.supports_batch = model.inputs[0].get_partial_shape()[0].is_dynamic
+        self.compiled_model = core.compile_model(model, 'CPU', config)
+        self.output = self.compiled_model.output(0)
+
+        metadata_path = os.path.join(model_dir, 'metadata.yaml')
+        if os.path.exists(metadata_path):
+            import yaml
+            with open(metadata_path) as f:
+                self.names = (yaml.safe_load(f) or {}).get('names', {})
+
+    def _infer(self, blob):
+        return self.compiled_model(blob)[self.output]
+
+
+def export_model(model_path, backend, imgsz=640):
+    """
+    Export file .pt sang ONNX hoặc OpenVINO IR và cache cạnh file gốc
+    Chỉ export lại khi file .pt mới hơn bản đã cache
+    Returns: đường dẫn file .onnx hoặc thư mục OpenVINO
+    """
+    base, _ = os.path.splitext(str(model_path))
+    if backend == 'onnx':
+        target = f"{base}.onnx"
+    elif backend == 'openvino':
+        target = f"{base}_openvino_model"
+    else:
+        raise Exception(f"Backend không hỗ trợ export: {backend}")
+
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(model_path):
+        return target
+
+    from .disease_detector import ModelLoader
+    print(f"Export {os.path.basename(str(model_path))} sang {backend}...")
+    model = ModelLoader.load_model(model_path)
+    exported = model.export(format=backend, imgsz=imgsz, dynamic=True)
+    return str(exported or target)
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_images(image_dir, limit=None):
+    """Danh sách file ảnh trong thư mục, sắp theo tên"""
+    files = sorted(
+        os.path.join(image_dir, f) for f in os.listdir(image_dir)
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return files[:limit] if limit else files
+
+
+def _calibration_reader(onnx_path, calibration_dir, imgsz, limit=200):
+    """CalibrationDataReader đọc các frame đã lưu trong calibration_dir"""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    input_name = ort.InferenceSession(
+        str(onnx_path), providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+
+    class FrameCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.files = iter(list_images(calibration_dir, limit))
+
+        def get_next(self):
+            for path in self.files:
+                image = cv2.imread(path)
+                if image is not None:
+                    blob, _ = preprocess_batch([image], imgsz)
+                    return {input_name: blob}
+            return None
+
+    return FrameCalibrationReader()
+
+
+def quantize_model(onnx_path, mode='dynamic', calibration_dir=None, imgsz=640):
+    """
+    Lượng tử hoá INT8 model ONNX và cache cạnh file gốc
+    mode: dynamic (chỉ weights) hoặc static (cần calibration_dir chứa frame đã lưu)
+    Returns: đường dẫn file .int8-<mode>.onnx
+    """
+    if not ONNXRUNTIME_AVAILABLE:
+        raise Exception("ONNX Runtime không khả dụng. Cần cài đặt onnxruntime")
+
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    base, _ = os.path.splitext(str(onnx_path))
+    target = f"{base}.int8-{mode}.onnx"
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(onnx_path):
+        return target
+
+    print(f"Quantize {os.path.basename(str(onnx_path))} sang INT8 ({mode})...")
+    if mode == 'dynamic':
+        quantize_dynamic(str(onnx_path), target, weight_type=QuantType.QUInt8)
+    elif mode == 'static':
+        if not calibration_dir or not os.path.isdir(calibration_dir) or not list_images(calibration_dir):
+            raise Exception(f"Không có frame calibration trong: {calibration_dir}")
+        quantize_static(
+            str(onnx_path), target,
+            _calibration_reader(onnx_path, calibration_dir, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8
+        )
+    else:
+        raise Exception(f"Chế độ quantize không hợp lệ: {mode}")
+
+    return target
+
+
+BACKENDS = {
+    'ultralytics': UltralyticsBackend,
+    'onnx': OnnxBackend,
+    'openvino': OpenVinoBackend,
+}
+
+
+def load_backend(model_path, backend='ultralytics', imgsz=640, threads=0,
+                 quantize='none', calibration_dir=None):
+    """
+    Tạo backend theo tên trong settings, fallback về ultralytics nếu không dùng được
+    quantize: none | dynamic | static - chạy bản INT8 qua ONNX Runtime
+    """
+    backend = (backend or 'ultralytics').lower()
+    if backend not in BACKENDS:
+        print(f"Backend không hợp lệ: {backend}, dùng ultralytics")
+        backend = 'ultralytics'
+
+    quantize = (quantize or 'none').lower()
+    if quantize != 'none':
+        try:
+            onnx_path = export_model(model_path, 'onnx', imgsz)
+            quantized_path = quantize_model(onnx_path, quantize, calibration_dir, imgsz)
+            model = OnnxBackend(quantized_path, threads=threads, imgsz=imgsz)
+            print(f"Model loaded với INT8 ({quantize}): {os.path.basename(quantized_path)}")
+            return model
+        except Exception as e:
+            print(f"Không thể dùng model INT8 ({quantize}): {e}, dùng backend {backend}")
+
+    if backend != 'ultralytics':
+        try:
+            exported_path = export_model(model_path, backend, imgsz)
+            model = BACKENDS[backend](exported_path, threads=threads, imgsz=imgsz)
+            print(f"Model loaded với backend {backend}: {os.path.basename(exported_path)}")
+            return model
+        except Exception as e:
+            print(f"Không thể dùng backend {backend}: {e}, fallback về ultralytics")
+
+    return UltralyticsBackend(model_path)
@@ -1,5 +1,22 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.urls import reverse
+
+
+class RecordedEventMixin:
+    """
+    Sự kiện xem lại được trên bản ghi DVR: clip quanh timestamp của sự kiện
+    Tính từ timestamp nên không cần thêm cột
+    """
+    
+    def clip_window(self):
+        from .recorder import clip_window
+        return clip_window(self.timestamp)
+    
+    @property
+    def clip_url(self):
+        start, end = self.clip_window()
+        return f"{reverse('app:recording_clip')}?start={start:.3f}&end={end:.3f}"
 
 
 class FeedingSchedule(models.Model):
@@ -17,7 +34,7 @@ class FeedingSchedule(models.Model):
         ordering = ['time']
 
 
-class FeedingLog(models.Model):
+class FeedingLog(RecordedEventMixin, models.Model):
     """
     Lịch sử cho ăn
     """
@@ -57,7 +74,7 @@ class SystemSettings(models.Model):
         verbose_name_plural = "Cài đặt hệ thống"
 
 
-class DiseaseDetection(models.Model):
+class DiseaseDetection(RecordedEventMixin, models.Model):
     """
     Kết quả phát hiện bệnh
     """
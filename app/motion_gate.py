@@ -0,0 +1,82 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cổng chuyển động rẻ tiền đặt trước YOLO:
+    so sánh frame grayscale thu nhỏ với frame ở lần detect gần nhất,
+    chỉ cho chạy model khi cảnh thay đổi
+    """
+
+    def __init__(self, threshold=0.01, pixel_delta=15, hysteresis_frames=5,
+                 max_skip_seconds=10, size=(80, 60)):
+        # threshold: tỉ lệ pixel thay đổi (0-1) để coi là có chuyển động
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        # Số frame tiếp tục detect sau khi hết chuyển động rồi mới coi là cảnh tĩnh
+        self.hysteresis_frames = hysteresis_frames
+        # Dù cảnh tĩnh vẫn detect lại sau khoảng này để làm mới kết quả
+        self.max_skip_seconds = max_skip_seconds
+        self.size = size
+
+        self.reference = None
+        self.last_score = 0.0
+        self.quiet_frames = 0
+        self.last_detect_time = 0
+        self.skipped = 0
+
+    @classmethod
+    def from_settings(cls, camera_settings):
+        return cls(
+            threshold=camera_settings.get('MOTION_THRESHOLD', 0.01),
+            pixel_delta=camera_settings.get('MOTION_PIXEL_DELTA', 15),
+            hysteresis_frames=camera_settings.get('MOTION_HYSTERESIS_FRAMES', 5),
+            max_skip_seconds=camera_settings.get('MOTION_MAX_SKIP_SECONDS', 10)
+        )
+
+    def _prepare(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def score(self, small):
+        """Tỉ lệ pixel khác frame tham chiếu quá pixel_delta"""
+        if self.reference is None or self.reference.shape != small.shape:
+            return 1.0
+        diff = cv2.absdiff(small, self.reference)
+        return float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+
+    def reset(self):
+        """Buộc lần gọi should_detect kế tiếp chạy model"""
+        self.reference = None
+
+    def should_detect(self, frame):
+        """
+        True nếu nên chạy model cho frame này
+        Khi trả về True, frame này trở thành frame tham chiếu mới
+        """
+        small = self._prepare(frame)
+        self.last_score = self.score(small)
+        now = time.time()
+
+        if self.last_score >= self.threshold:
+            self.quiet_frames = 0
+        else:
+            self.quiet_frames += 1
+
+        detect = (
+            self.quiet_frames <= self.hysteresis_frames
+            or now - self.last_detect_time >= self.max_skip_seconds
+        )
+
+        if detect:
+            self.reference = small
+            self.last_detect_time = now
+        else:
+            self.skipped += 1
+
+        return detect
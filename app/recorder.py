@@ -0,0 +1,290 @@
+import bisect
+import mmap
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from .camera_session import get_camera_session
+from .jpeg_transform import get_jpeg_transform
+
+
+# Một record trong file .idx của segment: thời điểm capture, vị trí và độ dài JPEG trong file .mjpeg
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('offset', '<u8'), ('size', '<u4')])
+
+
+class Segment:
+    """
+    Một segment trên đĩa: <start_ms>.mjpeg (các JPEG nối tiếp nhau) + <start_ms>.idx (mảng INDEX_DTYPE)
+    Đọc index bằng mmap nên tìm frame theo thời gian không phải đọc/quét file video
+    """
+
+    def __init__(self, directory, start_ms):
+        self.start_ms = start_ms
+        self.start = start_ms / 1000
+        self.data_path = os.path.join(directory, f"{start_ms}.mjpeg")
+        self.index_path = os.path.join(directory, f"{start_ms}.idx")
+
+    def size(self):
+        total = 0
+        for path in (self.data_path, self.index_path):
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def entries(self, start, end):
+        """Các record có timestamp trong [start, end], đọc qua mmap (copy phần nhỏ cần dùng)"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                length = os.fstat(f.fileno()).st_size // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize
+                if not length:
+                    return np.empty(0, dtype=INDEX_DTYPE)
+                with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as mapped:
+                    index = np.frombuffer(mapped, dtype=INDEX_DTYPE)
+                    timestamps = index['timestamp']
+                    lo = np.searchsorted(timestamps, start, side='left')
+                    hi = np.searchsorted(timestamps, end, side='right')
+                    entries = index[lo:hi].copy()
+                    # Bỏ reference tới buffer trước khi đóng mmap
+                    del index, timestamps
+                    return entries
+        except (OSError, ValueError):
+            return np.empty(0, dtype=INDEX_DTYPE)
+
+    def delete(self):
+        for path in (self.data_path, self.index_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class DvrRecorder:
+    """
+    Ghi liên tục stream của một camera ra đĩa thành các segment dài segment_seconds
+    - Frame lấy từ ring buffer của camera session (giữ session sống trong lúc ghi), tối đa fps frame/giây
+    - Nguồn có sẵn JPEG thì ghi thẳng JPEG (flip bằng JpegTransform), không decode/encode lại
+    - Xoá segment cũ nhất khi tổng dung lượng vượt max_bytes hoặc segment cũ hơn max_days
+    Xem lại bằng clip(start, end): đọc từng frame theo offset trong index, không giữ video trong RAM
+    """
+
+    def __init__(self, camera_id, directory, segment_seconds=60, fps=5, jpeg_quality=80,
+                 max_bytes=2 * 1024 ** 3, max_days=7):
+        self.camera_id = camera_id
+        self.directory = os.path.join(directory, camera_id)
+        self.segment_seconds = segment_seconds
+        self.fps = fps
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+        self.max_days = max_days
+
+        self.frames_written = 0
+        self.bytes_written = 0
+
+        self._segments = []
+        self._segments_lock = threading.Lock()
+        self._data_file = None
+        self._index_file = None
+        self._segment_end = 0
+        self._stop_event = None
+
+    @classmethod
+    def from_settings(cls, camera_id, recording_settings):
+        return cls(
+            camera_id,
+            recording_settings.get('DIR', 'recordings'),
+            segment_seconds=recording_settings.get('SEGMENT_SECONDS', 60),
+            fps=recording_settings.get('FPS', 5),
+            jpeg_quality=recording_settings.get('JPEG_QUALITY', 80),
+            max_bytes=recording_settings.get('MAX_BYTES', 2 * 1024 ** 3),
+            max_days=recording_settings.get('MAX_DAYS', 7)
+        )
+
+    @property
+    def running(self):
+        return self._stop_event is not None and not self._stop_event.is_set()
+
+    def start(self):
+        if self.running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_segments()
+        self._stop_event = threading.Event()
+        threading.Thread(
+            target=self._run, args=(self._stop_event,), name=f"dvr-{self.camera_id}", daemon=True
+        ).start()
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def _load_segments(self):
+        starts = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith('.idx') and name[:-4].isdigit()
+        )
+        with self._segments_lock:
+            self._segments = [Segment(self.directory, start_ms) for start_ms in starts]
+
+    def _run(self, stop_event):
+        session = get_camera_session(self.camera_id)
+        session.acquire()
+        print(f"DVR {self.camera_id}: ghi vào {self.directory}")
+        last_seq = 0
+        next_frame_at = 0
+        try:
+            while not stop_event.is_set():
+                item = session.frames.wait_for(last_seq, timeout=1, decode=False)
+                if item is None:
+                    continue
+                last_seq, timestamp, _ = item
+                if timestamp < next_frame_at:
+                    continue
+                next_frame_at = timestamp + 1 / self.fps if self.fps else 0
+
+                jpeg = self._to_jpeg(session.frames, last_seq)
+                if jpeg is not None:
+                    try:
+                        self._write(timestamp, jpeg)
+                    except OSError as e:
+                        print(f"DVR {self.camera_id}: lỗi ghi {e}")
+                        self._close_segment()
+                        stop_event.wait(1)
+        finally:
+            self._close_segment()
+            session.release()
+            print(f"DVR {self.camera_id}: đã dừng")
+
+    def _to_jpeg(self, frames, seq):
+        transform = get_jpeg_transform()
+        jpeg = frames.jpeg(seq)
+        if jpeg is not None:
+            return transform.apply(jpeg)
+        frame = frames.frame(seq)
+        if frame is None:
+            return None
+        ret, buffer = cv2.imencode(
+            '.jpg', transform.apply_frame(frame), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        )
+        return buffer.tobytes() if ret else None
+
+    def _write(self, timestamp, jpeg):
+        if self._data_file is None or timestamp >= self._segment_end:
+            self._open_segment(timestamp)
+
+        offset = self._data_file.tell()
+        self._data_file.write(jpeg)
+        self._data_file.flush()
+        # Ghi index sau khi dữ liệu đã xuống file, reader không bao giờ thấy offset chưa có dữ liệu
+        record = np.array([(timestamp, offset, len(jpeg))], dtype=INDEX_DTYPE)
+        self._index_file.write(record.tobytes())
+        self._index_file.flush()
+
+        self.frames_written += 1
+        self.bytes_written += len(jpeg) + INDEX_DTYPE.itemsize
+
+    def _open_segment(self, timestamp):
+        self._close_segment()
+        segment = Segment(self.directory, int(timestamp * 1000))
+        self._data_file = open(segment.data_path, 'ab')
+        self._index_file = open(segment.index_path, 'ab')
+        self._segment_end = timestamp + self.segment_seconds
+        with self._segments_lock:
+            if not self._segments or self._segments[-1].start_ms != segment.start_ms:
+                self._segments.append(segment)
+        self._enforce_retention()
+
+    def _close_segment(self):
+        for f in (self._data_file, self._index_file):
+            if f is not None:
+                f.close()
+        self._data_file = self._index_file = None
+
+    def _enforce_retention(self):
+        """Xoá segment cũ nhất (trừ segment đang ghi) tới khi thoả giới hạn dung lượng và số ngày"""
+        cutoff = time.time() - self.max_days * 86400 if self.max_days else None
+        with self._segments_lock:
+            total = sum(segment.size() for segment in self._segments) if self.max_bytes else 0
+            while len(self._segments) > 1:
+                oldest = self._segments[0]
+                too_old = cutoff is not None and self._segments[1].start < cutoff
+                too_big = self.max_bytes and total > self.max_bytes
+                if not too_old and not too_big:
+                    break
+                total -= oldest.size()
+                oldest.delete()
+                self._segments.pop(0)
+                print(f"DVR {self.camera_id}: xoá segment {oldest.start_ms}")
+
+    def _segments_between(self, start, end):
+        with self._segments_lock:
+            starts = [segment.start for segment in self._segments]
+            # Segment chứa start là segment cuối cùng bắt đầu trước start
+            first = max(0, bisect.bisect_right(starts, start) - 1)
+            last = bisect.bisect_right(starts, end)
+            return self._segments[first:last]
+
+    def has_footage(self, start, end):
+        return any(len(segment.entries(start, end)) for segment in self._segments_between(start, end))
+
+    def clip(self, start, end):
+        """
+        Generator (timestamp, jpeg) của các frame trong [start, end] (giây epoch)
+        Mỗi lần chỉ đọc một frame từ đĩa theo offset trong index
+        """
+        for segment in self._segments_between(start, end):
+            entries = segment.entries(start, end)
+            if not len(entries):
+                continue
+            try:
+                with open(segment.data_path, 'rb') as f:
+                    for timestamp, offset, size in entries.tolist():
+                        f.seek(offset)
+                        jpeg = f.read(size)
+                        if len(jpeg) == size:
+                            yield timestamp, jpeg
+            except OSError:
+                # Segment vừa bị xoá do retention
+                continue
+
+    def stats(self):
+        with self._segments_lock:
+            segments = list(self._segments)
+        return {
+            'running': self.running,
+            'segments': len(segments),
+            'bytes': sum(segment.size() for segment in segments),
+            'oldest': segments[0].start if segments else None,
+            'frames_written': self.frames_written,
+        }
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_recorder(camera_id='default'):
+    """Recorder của camera (chưa chạy cho tới khi start), None nếu RECORDING_SETTINGS tắt"""
+    from django.conf import settings
+    recording_settings = getattr(settings, 'RECORDING_SETTINGS', {})
+    if not recording_settings.get('ENABLED', False):
+        return None
+    with _recorders_lock:
+        recorder = _recorders.get(camera_id)
+        if recorder is None:
+            recorder = DvrRecorder.from_settings(camera_id, recording_settings)
+            _recorders[camera_id] = recorder
+        return recorder
+
+
+def clip_window(event_time):
+    """(start, end) giây epoch của clip quanh một sự kiện (datetime)"""
+    from django.conf import settings
+    recording_settings = getattr(settings, 'RECORDING_SETTINGS', {})
+    center = event_time.timestamp()
+    return (center - recording_settings.get('CLIP_BEFORE_SECONDS', 10),
+            center + recording_settings.get('CLIP_AFTER_SECONDS', 30))
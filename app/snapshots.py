@@ -0,0 +1,143 @@
+import threading
+import time
+
+import cv2
+
+from .camera_session import get_camera_session
+from .jpeg_transform import get_jpeg_transform
+
+
+class Snapshot:
+    """Một frame đã encode sẵn kèm ETag / Last-Modified để trả cho conditional GET"""
+    __slots__ = ('seq', 'timestamp', 'jpeg', 'etag')
+
+    def __init__(self, seq, timestamp, jpeg, variant):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.jpeg = jpeg
+        self.etag = f'"{variant}-{int(timestamp * 1000):x}-{seq:x}"'
+
+
+class SnapshotCache:
+    """
+    Ảnh mới nhất của một camera, encode tối đa một lần cho mỗi frame của ring buffer
+    và dùng chung cho mọi request (bản đầy đủ và thumbnail tạo riêng, chỉ khi có người hỏi)
+    - Frame cùng seq với lần trước: trả luôn bytes đã có, không encode
+    - Nguồn có sẵn JPEG: dùng thẳng JPEG (qua JpegTransform), không encode lại
+    - Frame cũ hơn max_stale_seconds và không có ai đang xem: mở capture (camera session)
+      chờ frame mới; session còn giữ capture thêm grace period nên các request sau đều trúng cache
+    """
+
+    def __init__(self, camera_id, thumbnail_width=320, thumbnail_quality=70, jpeg_quality=85,
+                 max_stale_seconds=2.0, wait_timeout=5.0):
+        self.camera_id = camera_id
+        self.thumbnail_width = thumbnail_width
+        self.thumbnail_quality = thumbnail_quality
+        self.jpeg_quality = jpeg_quality
+        self.max_stale_seconds = max_stale_seconds
+        self.wait_timeout = wait_timeout
+
+        self.hits = 0
+        self.misses = 0
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, camera_id, camera_settings):
+        return cls(
+            camera_id,
+            thumbnail_width=camera_settings.get('SNAPSHOT_THUMBNAIL_WIDTH', 320),
+            thumbnail_quality=camera_settings.get('SNAPSHOT_THUMBNAIL_QUALITY', 70),
+            max_stale_seconds=camera_settings.get('SNAPSHOT_MAX_STALE_SECONDS', 2.0)
+        )
+
+    def _refresh(self, session):
+        """Mở capture tạm thời và chờ frame mới hơn frame đang có (gọi từ thread)"""
+        session.acquire()
+        try:
+            session.frames.wait_for(session.frames.seq, self.wait_timeout)
+        finally:
+            session.release()
+
+    def peek(self, variant='full'):
+        """Snapshot đã cache nếu vẫn là frame mới nhất và còn mới, không bao giờ block; ngược lại None"""
+        session = get_camera_session(self.camera_id)
+        cached = self._snapshots.get(variant)
+        if cached is None or cached.seq != session.frames.seq:
+            return None
+        if not session.subscribers and time.time() - cached.timestamp >= self.max_stale_seconds:
+            return None
+        self.hits += 1
+        return cached
+
+    def get(self, variant='full'):
+        """
+        variant: 'full' hoặc 'thumb'
+        Returns: Snapshot hoặc None nếu camera chưa có frame (block khi phải mở capture, gọi từ thread)
+        """
+        cached = self.peek(variant)
+        if cached is not None:
+            return cached
+
+        session = get_camera_session(self.camera_id)
+        item = session.frames.latest(decode=False)
+        if item is None or (not session.subscribers and time.time() - item[1] >= self.max_stale_seconds):
+            self._refresh(session)
+
+        with self._lock:
+            item = session.frames.latest(decode=False)
+            if item is None:
+                return self._snapshots.get(variant)
+            seq, timestamp, _ = item
+
+            # Request khác có thể vừa encode xong frame này
+            cached = self._snapshots.get(variant)
+            if cached is not None and cached.seq == seq:
+                self.hits += 1
+                return cached
+
+            self.misses += 1
+            jpeg = self._encode(variant, session.frames, seq)
+            if jpeg is None:
+                return cached
+            snapshot = Snapshot(seq, timestamp, jpeg, variant)
+            self._snapshots[variant] = snapshot
+            return snapshot
+
+    def _encode(self, variant, frames, seq):
+        transform = get_jpeg_transform()
+        source_jpeg = frames.jpeg(seq)
+        if variant != 'thumb' and source_jpeg is not None:
+            return transform.apply(source_jpeg)
+
+        frame = frames.frame(seq)
+        if frame is None:
+            return None
+        if variant != 'thumb':
+            quality = self.jpeg_quality
+        else:
+            height, width = frame.shape[:2]
+            if width > self.thumbnail_width:
+                size = (self.thumbnail_width, max(1, round(height * self.thumbnail_width / width)))
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            quality = self.thumbnail_quality
+
+        ret, buffer = cv2.imencode('.jpg', transform.apply_frame(frame), [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if ret else None
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_snapshot_cache(camera_id='default'):
+    with _caches_lock:
+        cache = _caches.get(camera_id)
+        if cache is None:
+            from django.conf import settings
+            cache = SnapshotCache.from_settings(camera_id, getattr(settings, 'CAMERA_SETTINGS', {}))
+            _caches[camera_id] = cache
+        return cache
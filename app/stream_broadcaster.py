@@ -0,0 +1,156 @@
+import asyncio
+import threading
+
+from .stream_pipeline import StreamPipeline
+from .tracker import StreamCatTracker
+
+
+class StreamSubscription:
+    """
+    Một client đang xem camera, chỉ giữ frame mới nhất chưa gửi
+    Frame mới đánh thức get() ngay (không polling), max_fps giới hạn tốc độ gửi của riêng client này
+    Delta frame chỉ vẽ được trên đúng keyframe của nó: with_keyframe() thêm keyframe nếu client chưa có
+    """
+
+    def __init__(self, broadcaster, cat_detection=True, max_fps=None, client_overlay=False, queue_size=1):
+        self.broadcaster = broadcaster
+        self.cat_detection = cat_detection
+        # Client tự vẽ box từ detections: nhận frame không vẽ box
+        self.client_overlay = client_overlay
+        self.max_fps = max_fps
+        # Bậc chất lượng trong ladder của pipeline, FlowController của consumer điều chỉnh
+        self.level = 0
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._next_send_at = 0
+        self._sent_key = None
+
+    def deliver(self, variants):
+        """Chạy trên event loop, client chậm thì bỏ frame cũ chưa kịp gửi"""
+        preferred = 'annotated' if self.cat_detection and not self.client_overlay else 'plain'
+        stream_frame = (variants.get((preferred, self.level)) or variants.get(('plain', self.level))
+                        or next(iter(variants.values())))
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(stream_frame)
+
+    async def get(self, timeout=None):
+        """Chờ frame kế tiếp, None nếu hết timeout"""
+        loop = asyncio.get_running_loop()
+        max_fps = self.effective_max_fps()
+        if max_fps:
+            # Chờ tới lượt gửi, frame đến trong lúc chờ thay thế frame cũ nên gửi đi luôn là frame mới nhất
+            delay = self._next_send_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        try:
+            stream_frame = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        if max_fps:
+            self._next_send_at = loop.time() + 1 / max_fps
+        return stream_frame
+
+    def with_keyframe(self, stream_frame):
+        """Danh sách frame cần gửi theo thứ tự: keyframe (nếu client chưa có) rồi tới frame"""
+        if stream_frame.key is not None and stream_frame.key is not self._sent_key:
+            return [stream_frame.key, stream_frame]
+        return [stream_frame]
+
+    def mark_sent(self, stream_frame):
+        """Gọi sau khi đã gửi with_keyframe(stream_frame) cho client"""
+        self._sent_key = stream_frame.key or stream_frame
+
+    def effective_max_fps(self):
+        """FPS tối đa của client kết hợp với FPS của bậc chất lượng hiện tại (0/None = không giới hạn)"""
+        limits = [fps for fps in (self.max_fps, self.broadcaster.pipeline.ladder[self.level].max_fps) if fps]
+        return min(limits) if limits else None
+
+    def close(self):
+        self.broadcaster.unsubscribe(self)
+
+
+class StreamBroadcaster:
+    """
+    Một broadcaster cho mỗi camera: frame chỉ được flip, detect và encode một lần
+    trong StreamPipeline rồi phát cùng bytes đó cho mọi subscriber
+    """
+
+    def __init__(self, camera_id, get_frame_buffer, detector, camera_settings, loop):
+        self.camera_id = camera_id
+        self.subscribers = set()
+        self._last_variants = None
+        tracker = StreamCatTracker.from_settings(detector.cat_detector, camera_settings)
+        self.pipeline = StreamPipeline(
+            get_frame_buffer, detector, tracker, camera_settings, loop, on_frame=self._publish
+        )
+
+    def subscribe(self, cat_detection=True, max_fps=None, client_overlay=False):
+        subscription = StreamSubscription(self, cat_detection, max_fps, client_overlay)
+        self.subscribers.add(subscription)
+        self._update_variants()
+        if self.pipeline.running and self._last_variants:
+            # Client mới có hình ngay, không phải chờ frame kế tiếp (cảnh tĩnh có thể lâu mới có)
+            subscription.deliver(self._last_variants)
+        self.pipeline.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+        if self.subscribers:
+            self._update_variants()
+            return
+
+        self.pipeline.stop()
+        with _broadcasters_lock:
+            if _broadcasters.get(self.camera_id) is self:
+                del _broadcasters[self.camera_id]
+
+    def set_cat_detection(self, subscription, enabled):
+        subscription.cat_detection = enabled
+        self._update_variants()
+
+    def set_client_overlay(self, subscription, enabled):
+        subscription.client_overlay = enabled
+        self._update_variants()
+
+    def set_level(self, subscription, level):
+        level = max(0, min(level, len(self.pipeline.ladder) - 1))
+        if level != subscription.level:
+            subscription.level = level
+            self._update_variants()
+
+    def _update_variants(self):
+        """
+        Chỉ detect khi có client bật, chỉ vẽ box khi có client cần server vẽ,
+        chỉ encode bản không vẽ box khi có client tắt detect hoặc tự vẽ box
+        và chỉ encode các bậc chất lượng đang có client dùng
+        """
+        self.pipeline.set_cat_detection(any(s.cat_detection for s in self.subscribers))
+        self.pipeline.annotated_wanted = any(s.cat_detection and not s.client_overlay for s in self.subscribers)
+        self.pipeline.plain_wanted = any(not s.cat_detection or s.client_overlay for s in self.subscribers)
+        self.pipeline.wanted_levels = frozenset(s.level for s in self.subscribers) or frozenset([0])
+
+    def _publish(self, variants):
+        self._last_variants = variants
+        for subscription in list(self.subscribers):
+            subscription.deliver(variants)
+
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+
+def get_stream_broadcaster(camera_id, get_frame_buffer, detector, camera_settings):
+    """Lấy broadcaster của camera, tạo mới ở lần subscribe đầu tiên (gọi từ event loop)"""
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(camera_id)
+        if broadcaster is None:
+            broadcaster = StreamBroadcaster(
+                camera_id, get_frame_buffer, detector, camera_settings, asyncio.get_running_loop()
+            )
+            _broadcasters[camera_id] = broadcaster
+        return broadcaster
@@ -0,0 +1,122 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class DeltaEncoder:
+    """
+    Encode một variant của stream thành keyframe / delta theo tile cho camera gần như đứng yên
+    - Cảnh không đổi so với frame gửi gần nhất (và meta như detections cũng không đổi): bỏ qua, không encode
+    - Thay đổi cục bộ: chỉ encode các tile khác keyframe thành các JPEG nhỏ kèm toạ độ
+    - Thay đổi nhiều hoặc đã quá keyframe_interval giây: gửi keyframe đầy đủ
+    Delta luôn tính so với keyframe (không phải frame trước) nên client bỏ lỡ delta nào cũng không sao
+    """
+
+    def __init__(self, tile_size=64, pixel_delta=12, tile_threshold=0.01, max_changed_ratio=0.4,
+                 keyframe_interval=5.0, min_changed_pixels=4):
+        self.tile_size = int(tile_size)
+        # Pixel đổi quá pixel_delta (grayscale) mới tính, tile có hơn tile_threshold diện tích thật của tile
+        # (tile ở mép phải/dưới nhỏ hơn) và hơn min_changed_pixels pixel đổi mới gửi lại
+        self.pixel_delta = pixel_delta
+        self.tile_threshold = tile_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self.max_changed_ratio = max_changed_ratio
+        self.keyframe_interval = keyframe_interval
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.skipped = 0
+
+        self._key_gray = None
+        self._key_at = 0
+        self._sent_gray = None
+        self._sent_meta = None
+        self._limits = None
+
+    @classmethod
+    def from_settings(cls, camera_settings):
+        return cls(
+            tile_size=camera_settings.get('STREAM_DELTA_TILE_SIZE', 64),
+            pixel_delta=camera_settings.get('STREAM_DELTA_PIXEL_DELTA', 12),
+            max_changed_ratio=camera_settings.get('STREAM_DELTA_MAX_CHANGED_RATIO', 0.4),
+            keyframe_interval=camera_settings.get('STREAM_DELTA_KEYFRAME_INTERVAL', 5)
+        )
+
+    def _changed_tiles(self, gray, reference):
+        """Mảng bool (hàng tile, cột tile), True nếu tile khác reference"""
+        size = self.tile_size
+        height, width = gray.shape
+        rows, cols = -(-height // size), -(-width // size)
+
+        changed = np.zeros((rows * size, cols * size), dtype=np.uint8)
+        changed[:height, :width] = cv2.absdiff(gray, reference) > self.pixel_delta
+        counts = changed.reshape(rows, size, cols, size).sum(axis=(1, 3), dtype=np.int32)
+        return counts > self._tile_limits(height, width)
+
+    def _tile_limits(self, height, width):
+        """Số pixel đổi tối đa vẫn coi là tile không đổi, theo diện tích thật của từng tile"""
+        if self._limits is None or self._limits[0] != (height, width):
+            size = self.tile_size
+            heights = np.minimum(size, height - np.arange(0, height, size))
+            widths = np.minimum(size, width - np.arange(0, width, size))
+            limits = np.maximum(self.tile_threshold * np.outer(heights, widths), self.min_changed_pixels)
+            self._limits = ((height, width), limits)
+        return self._limits[1]
+
+    def _rects(self, changed, width, height):
+        """Gộp các tile liền nhau trên cùng một hàng thành một hình chữ nhật"""
+        size = self.tile_size
+        for row, cols in enumerate(changed):
+            col = 0
+            while col < len(cols):
+                if not cols[col]:
+                    col += 1
+                    continue
+                start = col
+                while col < len(cols) and cols[col]:
+                    col += 1
+                x, y = start * size, row * size
+                yield x, y, min(col * size, width) - x, min(y + size, height) - y
+
+    def _keyframe(self, image, gray, quality, now):
+        ret, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ret:
+            return None, None
+        self._key_gray = self._sent_gray = gray
+        self._key_at = now
+        self.keyframes += 1
+        return 'key', buffer.tobytes()
+
+    def encode(self, image, quality, meta=None):
+        """
+        meta: dữ liệu gửi kèm frame (vd detections), đổi thì vẫn gửi dù ảnh không đổi
+        Returns: ('key', jpeg) | ('delta', [(x, y, w, h, jpeg)]) | (None, None) nếu bỏ qua frame
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        now = time.monotonic()
+        if (self._key_gray is None or gray.shape != self._key_gray.shape
+                or now - self._key_at >= self.keyframe_interval):
+            self._sent_meta = meta
+            return self._keyframe(image, gray, quality, now)
+
+        if meta == self._sent_meta and not self._changed_tiles(gray, self._sent_gray).any():
+            self.skipped += 1
+            return None, None
+        self._sent_meta = meta
+
+        changed = self._changed_tiles(gray, self._key_gray)
+        if changed.mean() > self.max_changed_ratio:
+            return self._keyframe(image, gray, quality, now)
+
+        height, width = gray.shape
+        tiles = []
+        for x, y, w, h in self._rects(changed, width, height):
+            ret, buffer = cv2.imencode('.jpg', image[y:y + h, x:x + w], [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ret:
+                return self._keyframe(image, gray, quality, now)
+            tiles.append((x, y, w, h, buffer.tobytes()))
+
+        self._sent_gray = gray
+        self.deltas += 1
+        return 'delta', tiles
@@ -0,0 +1,297 @@
+import queue
+import threading
+import time
+
+import cv2
+
+from .detection_frames import get_detection_scaler
+from .jpeg_transform import get_jpeg_transform
+from .stream_delta import DeltaEncoder
+from .stream_protocol import pack_delta_frame, pack_video_frame
+from .stream_quality import parse_quality_ladder
+from .utils import get_flip_code
+
+
+def put_latest(target_queue, item):
+    """
+    Đưa item vào queue giới hạn, nếu đầy thì bỏ item cũ nhất
+    Returns: số item bị bỏ
+    """
+    dropped = 0
+    while True:
+        try:
+            target_queue.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                target_queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class StreamFrame:
+    """
+    Một frame đã xử lý xong, packet là bytes binary gửi thẳng cho client
+    Delta frame: jpeg là None, key là keyframe mà client phải có trước khi vẽ delta
+    """
+    __slots__ = ('seq', 'timestamp', 'jpeg', 'cats', 'packet', 'key')
+
+    def __init__(self, seq, timestamp, jpeg, cats, packet=None, key=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.jpeg = jpeg
+        self.cats = cats
+        self.packet = packet if packet is not None else pack_video_frame(seq, timestamp, jpeg, cats)
+        self.key = key
+
+
+class StreamPipeline:
+    """
+    Pipeline xử lý frame của một stream, mỗi stage chạy trên thread riêng:
+    capture -> prepare (flip) -> detect -> render (vẽ + JPEG encode + đóng gói) -> event loop
+    Giữa các stage là queue giới hạn, đầy thì bỏ frame cũ nhất nên stage chậm
+    không làm dồn frame; event loop chỉ nhận frame đã encode xong
+
+    on_frame: được gọi trên event loop với dict (overlay, bậc chất lượng) -> StreamFrame,
+    overlay 'annotated' có vẽ box mèo, 'plain' không vẽ,
+    bậc chất lượng là index trong QUALITY_LADDER, chỉ encode các bậc đang có client dùng
+    annotated_wanted: có client cần frame đã vẽ box (STREAM_OVERLAY_MODE 'server'); client
+    chọn 'client' nhận frame không vẽ kèm detections để tự vẽ, không ai cần thì bỏ qua bước vẽ
+    Frame không vẽ box ở bậc đầy đủ: nguồn có sẵn JPEG thì gửi thẳng JPEG đó (qua JpegTransform)
+    STREAM_DELTA_ENABLED: mỗi variant qua DeltaEncoder, frame không đổi bị bỏ qua,
+    thay đổi cục bộ chỉ gửi các tile đã đổi so với keyframe
+    """
+
+    def __init__(self, get_frame_buffer, detector, tracker, camera_settings, loop,
+                 on_frame, queue_size=1):
+        self.get_frame_buffer = get_frame_buffer
+        self.detector = detector
+        self.tracker = tracker
+        self.flip_code = get_flip_code(camera_settings)
+        self.confidence_threshold = camera_settings.get('DETECTION_CONFIDENCE_THRESHOLD', 0.5)
+        self.ladder = parse_quality_ladder(camera_settings.get('QUALITY_LADDER'))
+        self.scaler = get_detection_scaler()
+        self.camera_settings = camera_settings
+        self.delta_enabled = camera_settings.get('STREAM_DELTA_ENABLED', False)
+        self.loop = loop
+        self.on_frame = on_frame
+
+        self.cat_detection_enabled = True
+        # Có client cần frame không vẽ box dù đang bật detect
+        self.plain_wanted = False
+        # Có client cần frame đã vẽ box
+        self.annotated_wanted = True
+        self.wanted_levels = frozenset([0])
+        self.dropped = 0
+
+        self._prepare_queue = queue.Queue(maxsize=queue_size)
+        self._detect_queue = queue.Queue(maxsize=queue_size)
+        self._render_queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = None
+        self._seq = 0
+        self._source_seq = 0
+        # DeltaEncoder và keyframe hiện tại theo variant (overlay, bậc chất lượng)
+        self._delta_encoders = {}
+        self._keyframes = {}
+
+    @property
+    def running(self):
+        return self._stop_event is not None and not self._stop_event.is_set()
+
+    def start(self):
+        if self.running:
+            return
+        # Mỗi lần start có stop event riêng để thread của lần chạy trước tự thoát
+        self._stop_event = threading.Event()
+        self._delta_encoders = {}
+        self._keyframes = {}
+        threads = [
+            threading.Thread(
+                target=self._run_stage, args=(name, stage, self._stop_event),
+                name=f"stream-{name}", daemon=True
+            )
+            for name, stage in (
+                ('capture', self._capture),
+                ('prepare', self._prepare),
+                ('detect', self._detect),
+                ('render', self._render),
+            )
+        ]
+        for thread in threads:
+            thread.start()
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    def set_cat_detection(self, enabled):
+        if enabled != self.cat_detection_enabled:
+            self.cat_detection_enabled = enabled
+            self.tracker.reset()
+
+    def _run_stage(self, name, stage, stop_event):
+        while not stop_event.is_set():
+            try:
+                stage()
+            except Exception as e:
+                print(f"Stream pipeline lỗi ở stage {name}: {e}")
+                time.sleep(0.5)
+
+    def _next(self, source_queue):
+        try:
+            return source_queue.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    def _capture(self):
+        frame_buffer = self.get_frame_buffer()
+        if frame_buffer is None:
+            time.sleep(0.5)
+            return
+
+        item = frame_buffer.wait_for(self._source_seq, timeout=0.5, decode=False)
+        if item is None:
+            return
+
+        seq, timestamp, _ = item
+        if self._source_seq and seq > self._source_seq + 1:
+            self.dropped += seq - self._source_seq - 1
+        self._source_seq = seq
+
+        # Có JPEG mà chỉ cần gửi thẳng JPEG + detect trên ảnh thu nhỏ: không decode full frame
+        jpeg = frame_buffer.jpeg(seq)
+        frame = None
+        if jpeg is None or self._needs_full_frame():
+            frame = frame_buffer.frame(seq)
+            if frame is None:
+                return
+        self.dropped += put_latest(self._prepare_queue, (frame, jpeg, timestamp))
+
+    def _needs_full_frame(self):
+        """Có variant phải vẽ box / thu nhỏ / tính delta trên frame đã decode"""
+        return (self.delta_enabled or self.wanted_levels != {0} or self.ladder[0].scale != 1
+                or (self.annotated_wanted and self.cat_detection_enabled))
+
+    def _prepare(self):
+        item = self._next(self._prepare_queue)
+        if item is None:
+            return
+
+        frame, jpeg, timestamp = item
+        if frame is not None and self.flip_code is not None:
+            frame = cv2.flip(frame, self.flip_code)
+
+        # Ảnh riêng cỡ nhỏ cho detection, hiển thị vẫn dùng frame đầy đủ
+        detect_frame, scale = None, 1.0
+        if self.cat_detection_enabled:
+            if jpeg is not None:
+                detect_frame, scale = self.scaler.from_jpeg(jpeg)
+                if detect_frame is not None and self.flip_code is not None:
+                    detect_frame = cv2.flip(detect_frame, self.flip_code)
+            if detect_frame is None and frame is not None:
+                detect_frame, scale = self.scaler.from_frame(frame)
+        self.dropped += put_latest(self._detect_queue, (frame, jpeg, detect_frame, scale, timestamp))
+
+    def _detect(self):
+        item = self._next(self._detect_queue)
+        if item is None:
+            return
+
+        frame, jpeg, detect_frame, scale, timestamp = item
+        detections = None
+        if (detect_frame is not None and self.cat_detection_enabled
+                and self.detector.cat_detector.is_available()):
+            detections = self.tracker.process(detect_frame, self.confidence_threshold, scale)
+        self.dropped += put_latest(self._render_queue, (frame, jpeg, timestamp, detections))
+
+    def _render(self):
+        item = self._next(self._render_queue)
+        if item is None:
+            return
+
+        frame, jpeg, timestamp, detections = item
+        self._seq += 1
+        cats = detections.to_cat_list() if detections is not None else []
+
+        overlays = {}
+        if detections is not None and self.annotated_wanted and frame is not None:
+            # Chỉ vẽ bounding box mèo, không vẽ bệnh tự động
+            overlays['annotated'] = self.detector.cat_detector.draw_cat_boxes(frame.copy(), detections=detections)
+        if not overlays or self.plain_wanted:
+            overlays['plain'] = frame
+
+        # Mỗi variant chỉ encode một lần cho mọi client
+        variants = {}
+        for name, image in overlays.items():
+            for level in sorted(self.wanted_levels):
+                if name == 'plain' and level == 0 and self.ladder[0].scale == 1 and jpeg is not None \
+                        and not self.delta_enabled:
+                    # Frame không vẽ gì, đủ cỡ: gửi thẳng JPEG của camera, không encode lại
+                    stream_frame = self._passthrough(jpeg, timestamp, cats)
+                elif image is None:
+                    # Frame chưa decode (cấu hình client vừa đổi), variant này đợi frame sau
+                    continue
+                elif self.delta_enabled:
+                    stream_frame = self._encode_delta((name, level), image, timestamp, cats)
+                else:
+                    stream_frame = self._encode(image, timestamp, cats, self.ladder[level])
+                if stream_frame is not None:
+                    variants[(name, level)] = stream_frame
+
+        if self.delta_enabled:
+            # Variant không còn ai dùng: bỏ trạng thái, lần sau bắt đầu lại bằng keyframe
+            for key in list(self._delta_encoders):
+                if key[0] not in overlays or key[1] not in self.wanted_levels:
+                    del self._delta_encoders[key]
+                    self._keyframes.pop(key, None)
+        if not variants:
+            return
+
+        try:
+            self.loop.call_soon_threadsafe(self.on_frame, variants)
+        except RuntimeError:
+            # Event loop đã đóng
+            self.stop()
+
+    def _scale(self, frame, cats, level):
+        if level.scale == 1:
+            return frame, cats
+        frame = cv2.resize(frame, None, fx=level.scale, fy=level.scale, interpolation=cv2.INTER_AREA)
+        # Box theo toạ độ của ảnh đã thu nhỏ
+        cats = [
+            dict(cat, bbox=[int(round(v * level.scale)) for v in cat['bbox']]) for cat in cats
+        ]
+        return frame, cats
+
+    def _encode_delta(self, key, frame, timestamp, cats):
+        """Returns: StreamFrame keyframe/delta hoặc None nếu frame không đổi"""
+        level = self.ladder[key[1]]
+        frame, cats = self._scale(frame, cats, level)
+        encoder = self._delta_encoders.get(key)
+        if encoder is None:
+            encoder = self._delta_encoders[key] = DeltaEncoder.from_settings(self.camera_settings)
+
+        kind, data = encoder.encode(frame, level.quality, meta=cats)
+        if kind == 'key':
+            self._keyframes[key] = StreamFrame(self._seq, timestamp, data, cats)
+            return self._keyframes[key]
+        if kind == 'delta':
+            keyframe = self._keyframes[key]
+            packet = pack_delta_frame(self._seq, timestamp, keyframe.seq, data, cats)
+            return StreamFrame(self._seq, timestamp, None, cats, packet=packet, key=keyframe)
+        return None
+
+    def _passthrough(self, jpeg, timestamp, cats):
+        """Chỉ nguồn có JPEG (HTTP MJPEG); frame RTSP đi qua _encode"""
+        jpeg = get_jpeg_transform().apply(jpeg)
+        if jpeg is None:
+            return None
+        return StreamFrame(self._seq, timestamp, jpeg, cats)
+
+    def _encode(self, frame, timestamp, cats, level):
+        frame, cats = self._scale(frame, cats, level)
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, level.quality])
+        if not ret:
+            return None
+        return StreamFrame(self._seq, timestamp, buffer.tobytes(), cats)
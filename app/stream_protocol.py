@@ -0,0 +1,79 @@
+import json
+import struct
+
+
+# Frame video gửi qua /ws/video_stream/ dạng binary (big-endian), byte đầu là kiểu frame
+# Keyframe (1):
+#   version (uint8) | seq (uint32) | capture timestamp giây (float64) | độ dài detections (uint32)
+#   | detections JSON UTF-8 (có thể rỗng) | JPEG
+# Delta (2) - chỉ các tile đã đổi so với keyframe base_seq, client vẽ đè lên keyframe:
+#   version (uint8) | seq (uint32) | timestamp (float64) | độ dài detections (uint32) | base_seq (uint32)
+#   | detections JSON | số tile (uint16) | mỗi tile: x, y, w, h (uint16) | độ dài JPEG (uint32) | JPEG
+# Lệnh và status vẫn là JSON text
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('!BIdI')
+FRAME_DELTA_VERSION = 2
+DELTA_HEADER = struct.Struct('!BIdII')
+TILE_COUNT = struct.Struct('!H')
+TILE_HEADER = struct.Struct('!HHHHI')
+
+
+def _pack_detections(detections):
+    if not detections:
+        return b''
+    return json.dumps(detections, separators=(',', ':')).encode('utf-8')
+
+
+def pack_video_frame(seq, timestamp, jpeg, detections=None):
+    """Đóng gói một frame thành bytes gửi thẳng qua WebSocket"""
+    payload = _pack_detections(detections)
+    header = FRAME_HEADER.pack(FRAME_VERSION, seq & 0xFFFFFFFF, timestamp, len(payload))
+    return b''.join((header, payload, jpeg))
+
+
+def unpack_video_frame(data):
+    """Returns: (seq, timestamp, detections hoặc None, memoryview JPEG)"""
+    version, seq, timestamp, length = FRAME_HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise ValueError(f"Không hỗ trợ frame version {version}")
+
+    view = memoryview(data)
+    start = FRAME_HEADER.size
+    detections = json.loads(bytes(view[start:start + length])) if length else None
+    return seq, timestamp, detections, view[start + length:]
+
+
+def pack_delta_frame(seq, timestamp, base_seq, tiles, detections=None):
+    """tiles: list (x, y, w, h, jpeg) theo toạ độ keyframe"""
+    payload = _pack_detections(detections)
+    parts = [
+        DELTA_HEADER.pack(FRAME_DELTA_VERSION, seq & 0xFFFFFFFF, timestamp, len(payload), base_seq & 0xFFFFFFFF),
+        payload,
+        TILE_COUNT.pack(len(tiles)),
+    ]
+    for x, y, w, h, jpeg in tiles:
+        parts.append(TILE_HEADER.pack(x, y, w, h, len(jpeg)))
+        parts.append(jpeg)
+    return b''.join(parts)
+
+
+def unpack_delta_frame(data):
+    """Returns: (seq, timestamp, base_seq, detections hoặc None, list (x, y, w, h, memoryview JPEG))"""
+    version, seq, timestamp, length, base_seq = DELTA_HEADER.unpack_from(data)
+    if version != FRAME_DELTA_VERSION:
+        raise ValueError(f"Không phải delta frame (version {version})")
+
+    view = memoryview(data)
+    offset = DELTA_HEADER.size
+    detections = json.loads(bytes(view[offset:offset + length])) if length else None
+    offset += length
+
+    (count,) = TILE_COUNT.unpack_from(data, offset)
+    offset += TILE_COUNT.size
+    tiles = []
+    for _ in range(count):
+        x, y, w, h, size = TILE_HEADER.unpack_from(data, offset)
+        offset += TILE_HEADER.size
+        tiles.append((x, y, w, h, view[offset:offset + size]))
+        offset += size
+    return seq, timestamp, base_seq, detections, tiles
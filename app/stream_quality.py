@@ -0,0 +1,139 @@
+import time
+from collections import OrderedDict
+
+
+# Bậc chất lượng (tỉ lệ kích thước, JPEG quality, FPS tối đa - 0 là không giới hạn thêm), bậc 0 tốt nhất
+DEFAULT_QUALITY_LADDER = [
+    (1.0, 85, 0),
+    (1.0, 65, 0),
+    (0.5, 65, 10),
+    (0.5, 45, 5),
+]
+
+
+class QualityLevel:
+    __slots__ = ('scale', 'quality', 'max_fps')
+
+    def __init__(self, scale, quality, max_fps=0):
+        self.scale = float(scale)
+        self.quality = int(quality)
+        self.max_fps = float(max_fps)
+
+
+def parse_quality_ladder(value):
+    """'1.0:85:0,0.5:45:5' hoặc list tuple -> list QualityLevel"""
+    if not value:
+        value = DEFAULT_QUALITY_LADDER
+    if isinstance(value, str):
+        value = [tuple(float(part) for part in step.split(':')) for step in value.split(',') if step.strip()]
+    return [QualityLevel(*step) for step in value]
+
+
+class FlowController:
+    """
+    Kiểm soát luồng cho một client WebSocket dựa trên ack của client sau khi vẽ xong frame
+    - Giới hạn số byte / số frame đã gửi mà chưa được ack, vượt thì bỏ frame thay vì dồn vào buffer của Daphne
+    - Đo độ trễ gửi -> ack, tự hạ bậc chất lượng khi client chậm (trễ cao hoặc phải bỏ frame)
+      và nâng lại khi đường truyền ổn định
+    Client chưa từng ack (client cũ) thì không bị giới hạn
+    """
+
+    def __init__(self, num_levels, max_outstanding_bytes=512 * 1024, max_outstanding_frames=3,
+                 high_latency=0.5, low_latency=0.15, adjust_interval=1.0, stable_intervals=3,
+                 ack_timeout=5.0):
+        self.num_levels = num_levels
+        self.max_outstanding_bytes = max_outstanding_bytes
+        self.max_outstanding_frames = max_outstanding_frames
+        self.high_latency = high_latency
+        self.low_latency = low_latency
+        self.adjust_interval = adjust_interval
+        self.stable_intervals = stable_intervals
+        self.ack_timeout = ack_timeout
+
+        self.level = 0
+        self.latency = None
+        self.outstanding_bytes = 0
+        self.sent = 0
+        self.dropped = 0
+        self.acks_enabled = False
+
+        self._outstanding = OrderedDict()
+        self._window_dropped = 0
+        self._stable = 0
+        self._next_adjust_at = time.monotonic() + adjust_interval
+
+    def can_send(self, size):
+        if not self.acks_enabled:
+            return True
+        self._expire()
+        if not self._outstanding:
+            return True
+        return (len(self._outstanding) < self.max_outstanding_frames
+                and self.outstanding_bytes + size <= self.max_outstanding_bytes)
+
+    def on_sent(self, seq, size):
+        self.sent += 1
+        if not self.acks_enabled:
+            return
+        self._outstanding[seq] = (time.monotonic(), size)
+        self.outstanding_bytes += size
+
+    def on_dropped(self):
+        self.dropped += 1
+        self._window_dropped += 1
+
+    def on_ack(self, seq):
+        """Client đã vẽ xong frame seq, các frame gửi trước đó coi như đã tới"""
+        self.acks_enabled = True
+        now = time.monotonic()
+        while self._outstanding:
+            sent_seq, (sent_at, size) = next(iter(self._outstanding.items()))
+            if sent_seq > seq:
+                break
+            del self._outstanding[sent_seq]
+            self.outstanding_bytes -= size
+            if sent_seq == seq:
+                sample = now - sent_at
+                self.latency = sample if self.latency is None else 0.8 * self.latency + 0.2 * sample
+
+    def _expire(self):
+        """Frame quá lâu chưa được ack coi như mất, tránh kẹt vĩnh viễn"""
+        deadline = time.monotonic() - self.ack_timeout
+        while self._outstanding:
+            sent_seq, (sent_at, size) = next(iter(self._outstanding.items()))
+            if sent_at > deadline:
+                break
+            del self._outstanding[sent_seq]
+            self.outstanding_bytes -= size
+            self._window_dropped += 1
+
+    def update(self):
+        """Gọi sau mỗi frame, Returns: bậc chất lượng hiện tại"""
+        now = time.monotonic()
+        if not self.acks_enabled or now < self._next_adjust_at:
+            return self.level
+        self._next_adjust_at = now + self.adjust_interval
+
+        congested = self._window_dropped > 0 or (self.latency is not None and self.latency > self.high_latency)
+        self._window_dropped = 0
+
+        if congested:
+            self._stable = 0
+            self.level = min(self.level + 1, self.num_levels - 1)
+        elif self.latency is not None and self.latency < self.low_latency:
+            self._stable += 1
+            if self._stable >= self.stable_intervals and self.level > 0:
+                self._stable = 0
+                self.level -= 1
+        else:
+            self._stable = 0
+        return self.level
+
+    def stats(self):
+        return {
+            'level': self.level,
+            'latency': self.latency,
+            'outstanding_bytes': self.outstanding_bytes,
+            'sent': self.sent,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,209 @@
+import itertools
+
+import numpy as np
+
+from .disease_detector import Detections
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Ma trận IoU (len(a), len(b)) giữa hai tập box xyxy"""
+    if not len(boxes_a) or not len(boxes_b):
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = (bottom_right - top_left).clip(0).prod(axis=2)
+    area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).clip(0).prod(axis=1)
+    area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).clip(0).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-7)
+
+
+class KalmanBoxTrack:
+    """
+    Một con mèo đang được theo dõi: Kalman vận tốc không đổi trên (cx, cy, w, h)
+    """
+
+    # x' = F x, đo được 4 thành phần đầu của state
+    F = np.eye(8, dtype=np.float64)
+    F[:4, 4:] = np.eye(4)
+    H = np.eye(4, 8, dtype=np.float64)
+    Q = np.diag([1, 1, 1, 1, 0.05, 0.05, 0.05, 0.05]).astype(np.float64)
+    R = np.diag([4, 4, 10, 10]).astype(np.float64)
+
+    def __init__(self, track_id, box, score):
+        self.track_id = track_id
+        self.score = score
+        self.hits = 1
+        self.missed = 0
+        self.frames_since_update = 0
+
+        self.x = np.zeros(8, dtype=np.float64)
+        self.x[:4] = self._to_cxcywh(box)
+        self.P = np.diag([10, 10, 10, 10, 100, 100, 100, 100]).astype(np.float64)
+
+    @staticmethod
+    def _to_cxcywh(box):
+        x1, y1, x2, y2 = box
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        w, h = max(w, 1.0), max(h, 1.0)
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        self.frames_since_update += 1
+        return self.box()
+
+    def update(self, box, score):
+        z = self._to_cxcywh(box)
+        y = z - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+        self.score = score
+        self.hits += 1
+        self.missed = 0
+        self.frames_since_update = 0
+
+
+class CatTracker:
+    """
+    Tracker IoU + Kalman thuần NumPy, gán track id ổn định cho từng con mèo
+    update() sau mỗi lần chạy detector, predict() cho các frame ở giữa
+    Kết quả chỉ gồm track đã khớp ít nhất min_hits lần và khớp ở lần detector chạy gần nhất;
+    track vừa mất (mèo rời khung hình) vẫn giữ nội bộ tối đa max_missed lần để ghép lại id,
+    nhưng không hiển thị nên không có box "ma", một false positive lẻ cũng không hiện box
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=3, max_frames_without_update=30, min_hits=2):
+        self.iou_threshold = iou_threshold
+        # Số lần detector chạy mà không thấy track thì xoá track
+        self.max_missed = max_missed
+        self.max_frames_without_update = max_frames_without_update
+        self.min_hits = min_hits
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def _current(self):
+        tracks = [track for track in self.tracks if track.hits >= self.min_hits and not track.missed]
+        if not tracks:
+            return Detections(track_ids=[])
+        return Detections(
+            np.stack([track.box() for track in tracks]),
+            [track.score for track in tracks],
+            [0] * len(tracks),
+            ['cat'] * len(tracks),
+            track_ids=[track.track_id for track in tracks]
+        )
+
+    def predict(self):
+        """Đẩy mọi track tới frame tiếp theo mà không chạy model"""
+        for track in self.tracks:
+            track.predict()
+        self.tracks = [
+            track for track in self.tracks
+            if track.frames_since_update <= self.max_frames_without_update
+        ]
+        return self._current()
+
+    def update(self, detections):
+        """Ghép detections mới với các track (greedy theo IoU) và trả về kết quả có track id"""
+        predicted = (np.stack([track.predict() for track in self.tracks])
+                     if self.tracks else np.zeros((0, 4), dtype=np.float32))
+        boxes = detections.frame_boxes().astype(np.float32)
+        scores = detections.scores.tolist()
+
+        iou = iou_matrix(predicted, boxes)
+        matched_tracks, matched_boxes = set(), set()
+        while iou.size and iou.max() >= self.iou_threshold:
+            t, d = np.unravel_index(iou.argmax(), iou.shape)
+            self.tracks[t].update(boxes[d], scores[d])
+            matched_tracks.add(t)
+            matched_boxes.add(d)
+            iou[t, :] = -1
+            iou[:, d] = -1
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for d in range(len(boxes)):
+            if d not in matched_boxes:
+                self.tracks.append(KalmanBoxTrack(next(self._ids), boxes[d], scores[d]))
+
+        return self._current()
+
+    def reset(self):
+        self.tracks = []
+
+
+class StreamCatTracker:
+    """
+    Trạng thái detect của một stream: chỉ chạy cat detector mỗi detect_every frame
+    hoặc khi motion gate báo cảnh bắt đầu thay đổi, các frame còn lại dùng tracker
+    """
+
+    def __init__(self, cat_detector, detect_every=4, motion_gate=None, tracker=None):
+        self.cat_detector = cat_detector
+        self.detect_every = max(1, int(detect_every))
+        self.motion_gate = motion_gate
+        self.tracker = tracker or CatTracker()
+        self.frames_since_detect = None
+        self.last_detections = None
+        self._was_moving = False
+
+    @classmethod
+    def from_settings(cls, cat_detector, camera_settings):
+        from .motion_gate import MotionGate
+        motion_gate = None
+        if camera_settings.get('MOTION_GATE_ENABLED', False):
+            motion_gate = MotionGate.from_settings(camera_settings)
+        return cls(
+            cat_detector,
+            detect_every=camera_settings.get('TRACKER_DETECT_EVERY', 4),
+            motion_gate=motion_gate,
+            tracker=CatTracker(
+                iou_threshold=camera_settings.get('TRACKER_IOU_THRESHOLD', 0.3),
+                max_missed=camera_settings.get('TRACKER_MAX_MISSED', 3),
+                min_hits=camera_settings.get('TRACKER_MIN_HITS', 2)
+            )
+        )
+
+    def reset(self):
+        self.tracker.reset()
+        self.frames_since_detect = None
+        self.last_detections = None
+        self._was_moving = False
+        if self.motion_gate:
+            self.motion_gate.reset()
+
+    def process(self, frame, confidence_threshold=0.5, scale=1.0):
+        """
+        frame có thể là bản thu nhỏ (scale = tỉ lệ frame gốc / frame), box luôn theo toạ độ frame gốc
+        Returns: Detections (có track_ids) cho frame
+        """
+        moving = self.motion_gate.should_detect(frame) if self.motion_gate else True
+        motion_started = moving and not self._was_moving
+        self._was_moving = moving
+
+        # Cảnh tĩnh: mèo (nếu có) vẫn ở chỗ cũ
+        if not moving and self.last_detections is not None:
+            return self.last_detections
+
+        if (self.frames_since_detect is None or motion_started
+                or self.frames_since_detect + 1 >= self.detect_every):
+            detections = self.cat_detector.detect(frame, confidence_threshold, scale=scale)
+            self.last_detections = self.tracker.update(detections)
+            self.frames_since_detect = 0
+        else:
+            self.last_detections = self.tracker.predict()
+            self.frames_since_detect += 1
+
+        return self.last_detections
@@ -16,5 +16,8 @@ urlpatterns = [
     path('api/status/', views.get_status, name='get_status'),
     path('api/detect/', views.detect_disease, name='detect_disease'),
     path('api/feeding-data/', views.get_feeding_data, name='get_feeding_data'),
+    path('api/snapshot/', views.camera_snapshot, name='camera_snapshot'),
+    path('api/snapshot/<str:camera_id>/', views.camera_snapshot, name='camera_snapshot_by_id'),
     path('video-feed/', views.video_feed, name='video_feed'),
+    path('recordings/clip/', views.recording_clip, name='recording_clip'),
 ]
\ No newline at end of file
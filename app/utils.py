@@ -117,4 +117,23 @@ def create_blank_frame(message="Waiting for camera..."):
         cv2.putText(blank_frame, line, (x, y), font, font_scale, (255, 255, 255), thickness)
     
     _, buffer = cv2.imencode('.jpg', blank_frame)
-    return buffer.tobytes()
\ No newline at end of file
+    return buffer.tobytes()
+
+
+def get_flip_code(camera_settings):
+    """
+    Gộp FLIP_HORIZONTAL / FLIP_VERTICAL / ROTATE_180 thành một lần cv2.flip
+    (lật ngang + lật dọc == xoay 180)
+    Returns: flip code của cv2.flip hoặc None nếu không cần biến đổi
+    """
+    rotate_180 = camera_settings.get('ROTATE_180', False)
+    horizontal = camera_settings.get('FLIP_HORIZONTAL', False) != rotate_180
+    vertical = camera_settings.get('FLIP_VERTICAL', False) != rotate_180
+    
+    if horizontal and vertical:
+        return -1
+    if horizontal:
+        return 1
+    if vertical:
+        return 0
+    return None
@@ -2,16 +2,20 @@ from django.shortcuts import render, redirect
 from django.http import JsonResponse, StreamingHttpResponse, HttpResponse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_http_methods, require_POST
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
 from django.db import models
+import asyncio
 import json
-import time
 from .models import FeedingSchedule, FeedingLog, SystemSettings, DiseaseDetection
 from .mqtt_client import get_mqtt_manager
-from .utils import create_blank_frame
-from .disease_detector import get_cat_care_detector
+from .jpeg_transform import get_jpeg_transform
+from .mjpeg_relay import MJPEG_BOUNDARY, get_mjpeg_relay, mjpeg_part
+from .recorder import get_recorder
+from .snapshots import get_snapshot_cache
+from .camera_session import get_camera_session, get_camera_sessions_stats
 
 
 def login_view(request):
@@ -237,120 +241,117 @@ def change_mode(request):
 
 
 @login_required
-def video_feed(request):
+async def video_feed(request):
     """
-    Stream video từ ESP32 CAM HTTP stream với flip
+    Stream video của camera dạng MJPEG với flip
+    Mọi client dùng chung camera session (cùng kết nối với stream WebSocket) qua MjpegRelay, client chậm sẽ bỏ frame
     """
-    def generate():
-        import requests
-        import cv2
-        import numpy as np
-        from django.conf import settings
-        
-        esp32_ip = settings.ESP32_IP
-        stream_url = f"http://{esp32_ip}/stream"
-        
-        try:
-            print(f"Connecting to ESP32 stream: {stream_url}")
-            
-            response = requests.get(stream_url, stream=True, timeout=10)
-            response.raise_for_status()
-            print(f"Connected successfully. Content-Type: {response.headers.get('content-type', 'unknown')}")
-            
-            buffer = b''
-            frame_count = 0
-            
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    buffer += chunk
-                    
-                    while True:
-                        start = buffer.find(b'\xff\xd8')
-                        if start == -1:
-                            break
-                            
-                        end = buffer.find(b'\xff\xd9', start + 2)
-                        if end == -1:
-                            break
-                            
-                        jpeg_data = buffer[start:end+2]
-                        buffer = buffer[end+2:]
-                        
-                        if len(jpeg_data) > 1000:  
-                            nparr = np.frombuffer(jpeg_data, np.uint8)
-                            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                            
-                            if img is not None:
-                                camera_settings = getattr(settings, 'CAMERA_SETTINGS', {})
-                                
-                                if camera_settings.get('FLIP_HORIZONTAL', False):
-                                    img = cv2.flip(img, 1)
-                                
-                                if camera_settings.get('FLIP_VERTICAL', False):
-                                    img = cv2.flip(img, 0)
-                                
-                                if camera_settings.get('ROTATE_180', False):
-                                    img = cv2.flip(img, -1)
-                                
-                                # Encode lại thành JPEG
-                                ret, processed_jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                                
-                                if ret:
-                                    frame_count += 1
-                                    if frame_count % 100 == 0:
-                                        print(f"Processed {frame_count} frames")
-                                    
-                                    yield (b'--frame\r\n'
-                                           b'Content-Type: image/jpeg\r\n\r\n' + 
-                                           processed_jpeg.tobytes() + b'\r\n\r\n')
-                            else:
-                                # Nếu không decode được, dùng JPEG gốc
-                                yield (b'--frame\r\n'
-                                       b'Content-Type: image/jpeg\r\n\r\n' + 
-                                       jpeg_data + b'\r\n\r\n')
-                        
-        except Exception as e:
-            print(f"Stream error: {str(e)}")
-
-            while True:
-                blank_frame = create_blank_frame(f"Lỗi kết nối: {str(e)}")
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + blank_frame + b'\r\n\r\n')
-                time.sleep(1)
+    subscriber = get_mjpeg_relay().subscribe()
     
     return StreamingHttpResponse(
-        generate(), 
-        content_type='multipart/x-mixed-replace; boundary=frame'
+        subscriber.parts(), 
+        content_type=f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}'
     )
 
+async def _clip_parts(recorder, start, end, realtime):
+    """Đọc từng frame của clip trên thread pool, phát lại theo timestamp nếu realtime"""
+    frames = recorder.clip(start, end)
+    previous = None
+    while True:
+        item = await asyncio.to_thread(next, frames, None)
+        if item is None:
+            return
+        timestamp, jpeg = item
+        if realtime and previous is not None:
+            await asyncio.sleep(min(max(0, timestamp - previous), 1.0))
+        previous = timestamp
+        yield mjpeg_part(jpeg)
+
+
+@login_required
+async def recording_clip(request):
+    """
+    Xem lại bản ghi DVR từ start tới end (giây epoch) dạng MJPEG
+    ?download=1 tải clip về (không phát theo thời gian thực)
+    """
+    from django.conf import settings
+    recorder = get_recorder('default')
+    if recorder is None:
+        return JsonResponse({'success': False, 'message': 'Chưa bật ghi hình'}, status=404)
+    
+    try:
+        start = float(request.GET['start'])
+        end = float(request.GET['end'])
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'message': 'Thiếu start/end'}, status=400)
+    
+    max_clip_seconds = settings.RECORDING_SETTINGS.get('MAX_CLIP_SECONDS', 600)
+    if end <= start or end - start > max_clip_seconds:
+        return JsonResponse({'success': False, 'message': 'Khoảng thời gian không hợp lệ'}, status=400)
+    
+    if not await asyncio.to_thread(recorder.has_footage, start, end):
+        return JsonResponse({'success': False, 'message': 'Không có bản ghi trong khoảng này'}, status=404)
+    
+    download = request.GET.get('download') == '1'
+    response = StreamingHttpResponse(
+        _clip_parts(recorder, start, end, realtime=not download),
+        content_type=f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}'
+    )
+    if download:
+        response['Content-Disposition'] = f'attachment; filename="clip_{int(start)}_{int(end)}.mjpeg"'
+    return response
+
+def _snapshot_not_modified(request, snapshot):
+    """Conditional GET: If-None-Match ưu tiên hơn If-Modified-Since"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or snapshot.etag in tags
+    
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(snapshot.timestamp) <= if_modified_since
+
+
+@login_required
+async def camera_snapshot(request, camera_id='default'):
+    """
+    Ảnh mới nhất của camera lấy từ bộ nhớ, encode một lần mỗi frame và dùng chung cho mọi request
+    ?thumb=1 lấy thumbnail, ?max_age=N cho phép trình duyệt cache N giây (tối đa SNAPSHOT_MAX_AGE)
+    """
+    from django.conf import settings
+    if camera_id not in getattr(settings, 'CAMERA_SOURCES', {}):
+        return JsonResponse({'success': False, 'message': 'Camera không tồn tại'}, status=404)
+    
+    variant = 'thumb' if request.GET.get('thumb') == '1' else 'full'
+    cache = get_snapshot_cache(camera_id)
+    snapshot = cache.peek(variant)
+    if snapshot is None:
+        snapshot = await asyncio.to_thread(cache.get, variant)
+    if snapshot is None:
+        return JsonResponse({'success': False, 'message': 'Camera chưa có hình'}, status=503)
+    
+    if _snapshot_not_modified(request, snapshot):
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(snapshot.jpeg, content_type='image/jpeg')
+    
+    try:
+        max_age = int(request.GET.get('max_age', 0))
+    except ValueError:
+        max_age = 0
+    max_age = min(max(max_age, 0), settings.CAMERA_SETTINGS.get('SNAPSHOT_MAX_AGE', 10))
+    
+    response['ETag'] = snapshot.etag
+    response['Last-Modified'] = http_date(snapshot.timestamp)
+    response['Cache-Control'] = f'private, max-age={max_age}' if max_age else 'private, no-cache'
+    return response
+
 def process_image_flip(image_data):
     """
     Xử lý flip image theo settings
     """
     try:
-        import cv2
-        import numpy as np
-        from django.conf import settings
-        
-        camera_settings = getattr(settings, 'CAMERA_SETTINGS', {})
-        
-        nparr = np.frombuffer(image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            return image_data
-        
-        if camera_settings.get('FLIP_HORIZONTAL', False):
-            img = cv2.flip(img, 1) 
-            
-        if camera_settings.get('FLIP_VERTICAL', False):
-            img = cv2.flip(img, 0) 
-            
-        if camera_settings.get('ROTATE_180', False):
-            img = cv2.flip(img, -1)  
-        
-        _, buffer = cv2.imencode('.jpg', img)
-        return buffer.tobytes()
+        return get_jpeg_transform().apply(image_data)
         
     except Exception as e:
         print(f"Lỗi xử lý flip image: {e}")
@@ -358,46 +359,24 @@ def process_image_flip(image_data):
 
 def capture_frame_from_esp32():
     """
-    Capture frame từ ESP32 RTSP
+    Capture frame từ camera qua camera session dùng chung (không mở kết nối RTSP mới mỗi lần)
     """
+    session = get_camera_session('default')
+    session.acquire()
     try:
-        import cv2
-        from django.conf import settings
+        frame = session.wait_for_frame(timeout=5)
+        if frame is None:
+            print("Failed to capture frame from camera")
+            return None
         
-        esp32_ip = settings.ESP32_IP
-        rtsp_url = f"rtsp://{esp32_ip}:8554/mjpeg/1"
-        
-        print(f"Capturing frame from ESP32 RTSP: {rtsp_url}")
-        
-        cap = cv2.VideoCapture(rtsp_url)
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        cap.set(cv2.CAP_PROP_TIMEOUT, 5000)  
-        
-        for i in range(5):
-            ret, frame = cap.read()
-            if ret:
-                camera_settings = getattr(settings, 'CAMERA_SETTINGS', {})
-                
-                if camera_settings.get('FLIP_HORIZONTAL', False):
-                    frame = cv2.flip(frame, 1)
-                    
-                if camera_settings.get('FLIP_VERTICAL', False):
-                    frame = cv2.flip(frame, 0)
-                    
-                if camera_settings.get('ROTATE_180', False):
-                    frame = cv2.flip(frame, -1)
-                
-                cap.release()
-                print("Successfully captured frame from RTSP with OpenCV")
-                return frame
-        
-        cap.release()
-        print("Failed to capture frame from RTSP")
-        return None
+        print("Successfully captured frame from camera session")
+        return get_jpeg_transform().apply_frame(frame)
         
     except Exception as e:
-        print(f"Lỗi capture frame từ RTSP với OpenCV: {e}")
+        print(f"Lỗi capture frame từ camera: {e}")
         return None
+    finally:
+        session.release()
 
 
 @login_required
@@ -437,11 +416,15 @@ def get_status(request):
         timestamp__gte=today_start_utc
     ).count()
     
+    recorder = get_recorder('default')
+    
     return JsonResponse({
         'device_status': mqtt_manager.get_device_status(),
         'current_mode': current_mode,
         'feed_logs_count': today_logs_count,
         'is_connected': mqtt_manager.is_device_connected(),
+        'camera_sessions': get_camera_sessions_stats(),
+        'recording': recorder.stats() if recorder is not None else None,
         'timestamp': timezone.now().isoformat()
     })
 
@@ -538,6 +521,7 @@ def feeding_history(request):
         'auto_feeds': auto_feeds,
         'manual_feeds': manual_feeds,
         'days_count': days_count,
+        'recording_enabled': get_recorder('default') is not None,
     }
     
     return render(request, 'app/feeding_history.html', context)
@@ -546,12 +530,16 @@ def feeding_history(request):
 @login_required
 def disease_history(request):
     """
-    Lịch sử phát hiện bệnh
+    Lịch sử phát hiện bệnh, mỗi kết quả có link clip DVR quanh thời điểm phát hiện
     """
+    from django.core.paginator import Paginator
+    
     detections = DiseaseDetection.objects.filter(user=request.user)
+    paginator = Paginator(detections, 20)
     
     context = {
-        'detections': detections
+        'detections': paginator.get_page(request.GET.get('page')),
+        'recording_enabled': get_recorder('default') is not None,
     }
     
     return render(request, 'app/disease_history.html', context)